@@ -109,7 +109,7 @@ class CountCalls:
 
         # the return value of the original function call is returned to the caller
         return ret_val
-""")
+""", exports=["CountCalls"])
 
 print_md("""
 Lets intercept the say_miau function.
@@ -132,7 +132,7 @@ say_miau = CountCalls(say_miau)
 #
 say_miau()
 say_miau()
-""")
+""", exports=["say_miau"])
 
 print_md("now lets look at the properties of the say_miau variable")
 
@@ -237,7 +237,7 @@ def LimitCalls(function=None, max_hits=3, log_calls=False):
         return _LimitCalls(function, max_hits, log_calls)
 
     return wrapper
-""")
+""", exports=["LimitCalls"])
 
 print_md("""
 Lets use the LimitCalls decorator, here the defauls values for the parameters of the decorator are used. the LimitCalls function is called and it receives the square_me function as parameter, this results in an instantion of the internal _LimitsCalls object, in the same call.
@@ -275,7 +275,7 @@ eval_and_quote("""
 def cube_me(arg_num):
     ''' return a cube of the argument '''
     return arg_num * arg_num * arg_num
-""")
+""", exports=["cube_me"])
 
 print_md("""
 cube_me is a variable of type _LimitCalls
@@ -433,7 +433,7 @@ def LimitCalls2(_func = None, *,  max_hits = 3, log_calls = False):
         return forward_func_call
 
     return forward_func_call(_func)
-""")
+""", exports=["LimitCalls2"])
 
 print_md("""
 Calling without parameters: this declaration first calls the LimitCalls2 function with function argument set to the argument function dec_three_from_me.
@@ -593,7 +593,7 @@ class Colour:
 
 colour_red = Colour.from_name('red')
 print("color red: ", colour_red , "red:", colour_red.red , "green:", colour_red.green, "blue:", colour_red.blue)
-""")
+""", exports=["Colour"])
 
 print_md("""
 At first it doesn't make an awfull lot of sense, but lets derive the ColourWithAlphaChannel class from Colour.
@@ -654,7 +654,7 @@ def fib(arg_num):
     return fib(arg_num-1) + fib(arg_num-2)
 
 print("computing the fibonacci number of fib(30): ", fib(30))
-""")
+""", exports=["fib", "functools"])
 
 print_md("""
 A few word of caution: the @functools.cache decorator will not work, if the decorated function has side effects.
@@ -799,7 +799,7 @@ def readable_file_with_lock_shared(file_path):
         print("unlocking and closing file:", file_path)
         fcntl.lockf(file.fileno(), fcntl.LOCK_UN)
         file.close()
-""")
+""", exports=["readable_file_with_lock_shared", "writable_file_with_lock_exclusive"])
 
 print_md("""Using the resulting decorator""")
 
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import inspect
 from mdpyformat import *
 
 header_md("Generating sequences dynamically", nesting=1)
@@ -75,7 +76,7 @@ for _ in range(1,11):
     # calling the next built-in function with iterator argument is calling the __next__ member of the iterator object.
     fib_num = next(fib_iter)
     print(fib_num)
-""") 
+""", exports=["FibIterable"]) 
 
 header_md("Iterator objects used with for loops", nesting=4)
 
@@ -152,7 +153,7 @@ range_value = range(1,10)
 print("type(range_value):", type(range_value))
 assert not inspect.isgenerator(range_value)
 print("dir(range_value):", dir(range_value))
-""")
+""", exports=["range_value"])
 
 print_md("""The [inspect module](https://docs.python.org/3/library/inspect.html) actually does not have a function that checks, if an object is an iterator, one would look as follows:""")
 
@@ -172,7 +173,7 @@ def isiterator(arg_obj):
     return False
 
 assert isiterator(range_value)
-''')
+''', exports=["inspect"])
         
 
 print_md("""Each call to the __iter__() member of the range type will return a distinct value of type range_iterator, here the __next__ member is implemented. """)
@@ -243,7 +244,7 @@ print("type(not_a_generator):", not_a_generator)
 
 no_gen_ret_val = not_a_generator(10, 20)
 print("type(no_gen_ret_val):", type(no_gen_ret_val))
-""")
+""", exports=["not_a_generator"])
 
 print_md("""Let's look at a generator function, it has a yield statement in its body""")
 
@@ -261,7 +262,7 @@ def my_range(from_val, to_val):
         from_val += 1
 
     print("(generator) leaving the generator function, iteration is finished")
-""")
+""", exports=["my_range"])
 
 print_md("""A function that has a yield statement, is is technically still a function objct.""")
 eval_and_quote("""
@@ -275,7 +276,7 @@ import inspect
 
 assert inspect.isgeneratorfunction(my_range)
 assert not inspect.isgeneratorfunction(not_a_generator)
-""")
+""", exports=["inspect"])
 
 print_md("""Digression: the __code__ attribute of a function object stands for the compiled byte code of a function. (but that's another rabbit hole)""")
 
@@ -290,7 +291,7 @@ eval_and_quote("""
 print("calling: my_range(10,20)")
 range_generator = my_range(10,12)
 print("type(range_generator):", type(range_generator))
-""")
+""", exports=["range_generator"])
 
 print_md("The generator has not been invoked yet, it is in created state")
 eval_and_quote("""
@@ -5,7 +5,6 @@ set -ex
 python3 -m venv req-venv
 source req-venv/bin/activate
 
-pip3 install subb
 
 pip3 freeze >requirements.txt
 
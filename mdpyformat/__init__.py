@@ -1 +1,3 @@
 from .mdf import  *
+from .mdf import __all__
+from .version import VERSION as __version__
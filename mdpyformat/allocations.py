@@ -0,0 +1,83 @@
+import os
+import io
+import gc
+import tracemalloc
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+# file name of the code of a snippet (see eventloop.compile_snippet)
+_SNIPPET_FILE = "<string>"
+
+
+class AllocationTracker:
+    """ context manager that traces the memory allocated while a snippet is running, with tracemalloc.
+        After the snippet: peak is the highest amount of memory allocated on top of what was in use before the snippet, retained is the net amount that is still in use.
+        sites() groups the retained memory by line of the snippet """
+
+    def __init__(self, num_frames):
+        self.num_frames = num_frames
+        self.was_tracing = False
+        self.start_size = 0
+        self.peak = 0
+        self.retained = 0
+        self.before = None
+        self.after = None
+
+    def __enter__(self):
+        # print() sets up the parser of its keyword arguments on its first call, that memory is not allocated by the snippet
+        print(end="", file=io.StringIO())
+        gc.collect()
+        self.was_tracing = tracemalloc.is_tracing()
+        # if tracing is on already (performance report), its number of frames is kept
+        if not self.was_tracing:
+            tracemalloc.start(self.num_frames)
+        self.before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        self.start_size = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info):
+        peak = tracemalloc.get_traced_memory()[1]
+        gc.collect()
+        # both sizes are read before the snapshot, that is traced too
+        current = tracemalloc.get_traced_memory()[0]
+        self.retained = current - self.start_size
+        self.peak = max(peak, current) - self.start_size
+        self.after = tracemalloc.take_snapshot()
+        if not self.was_tracing:
+            tracemalloc.stop()
+        return False
+
+    def sites(self, top):
+        """ the top lines of the snippet by retained memory, as (line number, size, count) """
+        by_line = {}
+        for stat in self.after.compare_to(self.before, "traceback"):
+            if stat.size_diff <= 0:
+                continue
+            line = _snippet_line(stat.traceback)
+            if line is None:
+                continue
+            size, count = by_line.get(line, (0, 0))
+            by_line[line] = (size + stat.size_diff, count + stat.count_diff)
+        sites = sorted( map( lambda item : (item[0], item[1][0], item[1][1]), by_line.items() ), key=lambda site : site[1], reverse=True )
+        return sites[ : top ]
+
+
+def _snippet_line(traceback):
+    # the innermost frame of the snippet that led to the allocation (the frames of a traceback go from the oldest to the most recent);
+    # allocations made by mdpyformat itself, when called from the snippet (captured output), don't count
+    for frame in reversed(traceback):
+        if frame.filename == _SNIPPET_FILE:
+            return frame.lineno
+        if frame.filename.startswith(_PACKAGE_DIR):
+            return None
+    return None
+
+def format_table(sites, arg_str, format_size):
+    """ markdown table of the allocation sites returned by AllocationTracker.sites """
+    code_lines = arg_str.split("\n")
+    lines = [ "| line | source | retained | blocks |", "|-----:|:-------|---------:|-------:|" ]
+    for line, size, count in sites:
+        source = code_lines[ line - 1 ].strip() if len(code_lines) >= line else ""
+        source = source.replace("|", "\\|")
+        lines.append(f"| {line} | `{source}` | {format_size(size)} | {count} |")
+    return "\n".join(lines) + "\n"
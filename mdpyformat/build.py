@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# runs a lesson and adds the table of contents in a single process, without a temporary file:
+#
+#   python3 -m mdpyformat.build LESSON.py OUT.md
+#
+# does the same as:
+#
+#   ./LESSON.py >LESSON.tmp
+#   python3 -m mdpyformat.tocgen LESSON.tmp OUT.md
+
+import os
+import io
+import sys
+import runpy
+from . import tocgen
+from . import mdf as _mdf
+from . import normalize as _normalize
+from .cfg import MdfCfg
+from .document import Document, use_document, release_document
+
+
+def run_lesson(lesson):
+    """ run the lesson script in this process, returns (markdown text, exit code) """
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    sys.argv = [ lesson ]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(lesson)))
+
+    document = use_document(Document(normalizer=_normalize.make_normalizer()))
+    _normalize.seed_random()
+    exit_code = 0
+    try:
+        runpy.run_path(lesson, run_name="__main__")
+        # commands of run_and_quote may still be running (with MdfCfg.concurrent_runs), wait for them.
+        document.resolve_placeholders()
+    except SystemExit as ex:
+        exit_code = ex.code if isinstance(ex.code, int) else (0 if ex.code is None else 1)
+    finally:
+        # keep-going mode: the failures are shown, the lesson exits with an error
+        if _mdf._finish_lesson() and exit_code == 0:
+            exit_code = 1
+        text = document.getvalue()
+        release_document()
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+    return text, exit_code
+
+def build_lesson(lesson, out_file):
+    """ run the lesson, and write its markdown with a table of contents to out_file. The output file is not written if the lesson fails,
+        unless in keep-going mode: there the document shows the errors of the failed snippets """
+    text, exit_code = run_lesson(lesson)
+    if exit_code == 0 or MdfCfg.keep_going:
+        tocgen.processFile(io.StringIO(text), out_file)
+    return exit_code
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python3 -m mdpyformat.build LESSON.py OUT.md", file=sys.stderr)
+        sys.exit(1)
+    if _normalize.needs_hash_seed(os.environ):
+        # the hash seed takes effect in a new interpreter: start the build again, with PYTHONHASHSEED set
+        os.environ["PYTHONHASHSEED"] = str(MdfCfg.random_seed)
+        os.execv(sys.executable, [ sys.executable, "-m", "mdpyformat.build" ] + sys.argv[1:])
+    sys.exit(build_lesson(sys.argv[1], sys.argv[2]))
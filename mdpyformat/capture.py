@@ -0,0 +1,230 @@
+import io
+import sys
+import codecs
+import threading
+import contextvars
+import contextlib
+import collections
+
+# files and pipes are read in chunks of this number of bytes
+CHUNK_SIZE = 64 * 1024
+
+
+class OutputText(str):
+    """ text that shows captured output: a document normalizes it, if it has a normalizer (see document.Document) """
+
+
+class OutputSink(io.TextIOBase):
+    """ file object that captures the output of a snippet, line by line.
+        The output is rendered as by strip() and a line prefix; with a target stream, the rendered lines are written there as they arrive.
+        With max_lines set, only the first and the last max_lines lines are kept, and a marker line replaces the lines in between.
+        Memory use is bounded by 2 * max_lines lines (plus the trailing whitespace lines that are still held back).
+        block_start and block_end are written to target before the first and after the last line, quote is applied to each rendered line.
+        The rendered lines are written as OutputText """
+
+    def __init__(self, line_prefix, max_lines=None, target=None, on_first_line=None, block_start="```\n", block_end="```\n\n", quote=None):
+        super().__init__()
+        self.line_prefix = line_prefix
+        self.max_lines = max_lines
+        self.target = target
+        # called before the first line is written to target (shows the header of the result block)
+        self.on_first_line = on_first_line
+        self.block_start = block_start
+        self.block_end = block_end
+        self.quote = quote
+
+        self.partial = []
+        self.started = False
+        # last line with content, and the whitespace lines that follow it. These are dropped, if they turn out to be at the end of the output
+        self.held = None
+        self.pending = []
+
+        self.head = []
+        self.tail = collections.deque(maxlen=max_lines) if max_lines else None
+        self.dropped = 0
+        self.closed_output = False
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        pieces = text.split("\n")
+        for piece in pieces[:-1]:
+            self.partial.append(piece)
+            self._add_line("".join(self.partial))
+            self.partial = []
+        if pieces[-1]:
+            self.partial.append(pieces[-1])
+        return len(text)
+
+    def _add_line(self, line):
+        if line.strip() == "":
+            # leading whitespace lines are skipped, the others are held back until there is more content
+            if self.started:
+                self.pending.append(line)
+                if self.max_lines and len(self.pending) > self.max_lines:
+                    self._release()
+            return
+        if not self.started:
+            self.started = True
+            line = line.lstrip()
+        self._release()
+        self.held = line
+
+    def _release(self):
+        if self.held is not None:
+            self._emit(self.held)
+            self.held = None
+        for line in self.pending:
+            self._emit(line)
+        self.pending = []
+
+    def _emit(self, line):
+        if not self.max_lines or len(self.head) < self.max_lines:
+            self.head.append(line)
+            self._write_line(line)
+        else:
+            if len(self.tail) == self.max_lines:
+                self.dropped += 1
+            self.tail.append(line)
+
+    def _write_line(self, line):
+        if self.target is None:
+            return
+        if len(self.head) == 1:
+            if self.on_first_line is not None:
+                self.on_first_line()
+            self.target.write(self.block_start)
+        self._render(line)
+
+    def _render(self, line):
+        text = self.line_prefix + line
+        if self.quote is not None:
+            text = self.quote(text)
+        self.target.write(OutputText(text + "\n"))
+
+    def _elision_marker(self):
+        return f"... {self.dropped} lines not shown ..."
+
+    def close_output(self):
+        """ end of the output: write the held back lines, the marker for elided lines and the tail. Returns the kept text """
+        if not self.closed_output:
+            self.closed_output = True
+            if self.partial:
+                self._add_line("".join(self.partial))
+                self.partial = []
+            if self.held is not None:
+                self._emit(self.held.rstrip())
+                self.held = None
+            self.pending = []
+            if self.target is not None and self.head:
+                if self.dropped:
+                    self._render(self._elision_marker())
+                for line in self.tail or []:
+                    self._render(line)
+                self.target.write(self.block_end)
+        return self.text()
+
+    def has_content(self):
+        return bool(self.head)
+
+    def text(self):
+        """ the kept lines, without prefix """
+        lines = list(self.head)
+        if self.dropped:
+            lines.append(self._elision_marker())
+        if self.tail:
+            lines.extend(self.tail)
+        return "\n".join(lines)
+
+
+def copy_chunks(read, output, max_bytes=None, translate_newlines=False):
+    """ copy utf-8 text in chunks, read(size) returns the next chunk of bytes (empty at the end), the decoded text is written to output.
+        With max_bytes set, only the first max_bytes bytes are written, the rest is read and dropped. Returns the number of dropped bytes.
+        translate_newlines: \\r\\n and \\r become \\n, as when reading a file in text mode """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    if translate_newlines:
+        decoder = io.IncrementalNewlineDecoder(decoder, translate=True)
+    copied = 0
+    dropped = 0
+    while True:
+        chunk = read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if max_bytes is not None and copied + len(chunk) > max_bytes:
+            dropped += copied + len(chunk) - max_bytes
+            chunk = chunk[ : max_bytes - copied ]
+        copied += len(chunk)
+        if chunk:
+            output.write(decoder.decode(chunk))
+    output.write(decoder.decode(b"", final=True))
+    return dropped
+
+def cut_off_marker(dropped):
+    return f"... {dropped} more bytes not shown ..."
+
+
+# the stream that gets the writes to sys.stdout / sys.stderr in the current context (thread, task), None means: the stream that was replaced
+_redirect_targets = { "stdout" : contextvars.ContextVar("mdf_stdout", default=None), "stderr" : contextvars.ContextVar("mdf_stderr", default=None) }
+# number of active redirections of each stream. While there are any, sys.stdout / sys.stderr is a ContextStream
+_redirect_counts = { "stdout" : 0, "stderr" : 0 }
+_redirect_lock = threading.Lock()
+
+
+class ContextStream(io.TextIOBase):
+    """ stands in for sys.stdout or sys.stderr while output is redirected: writes go to the target of the current context (see redirect),
+        or to the replaced stream, if the current context has no target. Snippets in different threads or tasks don't mix their output """
+
+    def __init__(self, name, default):
+        super().__init__()
+        self.name = name
+        self.default = default
+
+    def target(self):
+        target = _redirect_targets[self.name].get()
+        return target if target is not None else self.default
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def isatty(self):
+        return self.target().isatty()
+
+    def fileno(self):
+        return self.target().fileno()
+
+    @property
+    def encoding(self):
+        return getattr(self.target(), "encoding", "utf-8")
+
+
+def resolve(stream):
+    """ the stream that gets the writes to stream in the current context """
+    while isinstance(stream, ContextStream):
+        stream = stream.target()
+    return stream
+
+@contextlib.contextmanager
+def redirect(name, stream):
+    """ writes to sys.<name> ("stdout" or "stderr") go to stream, in the current context only (the current thread, and the tasks it creates) """
+    with _redirect_lock:
+        if _redirect_counts[name] == 0 and not isinstance(getattr(sys, name), ContextStream):
+            setattr(sys, name, ContextStream(name, getattr(sys, name)))
+        _redirect_counts[name] += 1
+    token = _redirect_targets[name].set(stream)
+    try:
+        yield stream
+    finally:
+        _redirect_targets[name].reset(token)
+        with _redirect_lock:
+            _redirect_counts[name] -= 1
+            current = getattr(sys, name)
+            if _redirect_counts[name] == 0 and isinstance(current, ContextStream):
+                # the stream is replaced only while redirections are active, code that swaps sys.stdout (use_document) sees the usual stream otherwise
+                setattr(sys, name, current.default)
@@ -0,0 +1,140 @@
+import os
+
+def _env_number(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+def _env_flag(name):
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+class MdfCfg:
+    # directory of the on-disk cache for eval_and_quote results. Caching is off, if this is None.
+    # (default is taken from the MDF_CACHE_DIR environment variable)
+    cache_dir = os.environ.get("MDF_CACHE_DIR")
+
+    # least recently used cache entries are evicted, once the cache directory grows beyond this number of bytes
+    cache_max_bytes = int(os.environ.get("MDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    # incremental mode: the cache key of a snippet covers only the snippets it depends on (by global names read and written),
+    # so that editing a snippet re-runs just the edited snippet and the snippets that depend on it. (needs cache_dir)
+    # (default is taken from the MDF_INCREMENTAL environment variable)
+    incremental = _env_flag("MDF_INCREMENTAL")
+
+    # unix domain socket of the checkpoint build daemon (python3 -m mdpyformat.checkpoint serve)
+    checkpoint_socket = os.environ.get("MDF_CHECKPOINT_SOCKET", f"/tmp/mdf-checkpoint-{os.getuid()}.sock")
+
+    # maximum number of checkpoint processes kept by the checkpoint build daemon
+    max_checkpoints = int(os.environ.get("MDF_MAX_CHECKPOINTS", "32"))
+
+    # run the snippets of a lesson in a process pool, snippets that don't depend on each other run at the same time.
+    # (default is taken from the MDF_PARALLEL environment variable)
+    parallel = _env_flag("MDF_PARALLEL")
+
+    # number of worker processes for parallel mode, None means: one per cpu.
+    max_workers = int(os.environ.get("MDF_MAX_WORKERS", "0")) or None
+
+    # parallel mode runs the snippets in forked processes ("process"), in threads of this process ("thread": the snippets share the objects
+    # that exist when the lesson starts, this gives real parallelism on free-threaded builds of python),
+    # or in sub-interpreters with their own GIL ("interpreter", python 3.12 and later; snippets are evaluated in-process on older versions).
+    # (default is taken from the MDF_PARALLEL_BACKEND environment variable)
+    parallel_backend = os.environ.get("MDF_PARALLEL_BACKEND", "process")
+
+    # record wall time, cpu time, peak memory and output size of each snippet. At exit the records are written to LESSON.perf.json,
+    # and the perf_top slowest snippets are shown on standard error.
+    # (defaults are taken from the MDF_PERF_REPORT and MDF_PERF_TOP environment variables)
+    perf_report = _env_flag("MDF_PERF_REPORT")
+    perf_top = int(os.environ.get("MDF_PERF_TOP", "10"))
+
+    # default limits for eval_and_quote and run_and_quote: wall time and cpu time in seconds, memory in bytes. None means: no limit
+    # (defaults are taken from the MDF_TIMEOUT, MDF_CPU_LIMIT and MDF_MEMORY_LIMIT environment variables)
+    timeout = _env_number("MDF_TIMEOUT")
+    cpu_limit = _env_number("MDF_CPU_LIMIT")
+    memory_limit = int(_env_number("MDF_MEMORY_LIMIT")) if _env_number("MDF_MEMORY_LIMIT") else None
+
+    # run_and_quote starts the command in a thread pool and returns at once, a placeholder in the document is filled with the result later (in source order).
+    # max_concurrent_runs is the number of commands that run at the same time, None means: one per cpu.
+    # (defaults are taken from the MDF_CONCURRENT_RUNS and MDF_MAX_CONCURRENT_RUNS environment variables)
+    concurrent_runs = _env_flag("MDF_CONCURRENT_RUNS")
+    max_concurrent_runs = int(os.environ.get("MDF_MAX_CONCURRENT_RUNS", "0")) or None
+
+    # environment variables that are part of the cache key of run_and_quote results (shell style patterns). The cache is on if cache_dir is set.
+    run_cache_env = ( "PATH", "LANG", "LC_*", "PYTHON*" )
+
+    # ignore cached results of run_and_quote, the files are run again and the cache entries are replaced.
+    # (default is taken from the MDF_INVALIDATE_RUN_CACHE environment variable)
+    invalidate_run_cache = _env_flag("MDF_INVALIDATE_RUN_CACHE")
+
+    # run_and_quote shows at most this number of bytes of a source file, and of the output of a command. None or 0 means: no limit
+    # (default is taken from the MDF_MAX_RENDER_BYTES environment variable)
+    max_render_bytes = int(os.environ.get("MDF_MAX_RENDER_BYTES", "0")) or None
+
+    # keep only the first and the last max_output_lines lines of the output of a snippet, None or 0 means: no limit
+    # (default is taken from the MDF_MAX_OUTPUT_LINES environment variable)
+    max_output_lines = int(os.environ.get("MDF_MAX_OUTPUT_LINES", "10000")) or None
+
+    # run_and_quote runs python files in workers forked from a warm interpreter (zygote), instead of starting a new python process for each file.
+    # Only used if the command is the current python interpreter, and no limits are set.
+    # (defaults are taken from the MDF_WARM_POOL and MDF_WARM_WORKERS environment variables)
+    warm_pool = _env_flag("MDF_WARM_POOL")
+    warm_workers = int(os.environ.get("MDF_WARM_WORKERS", "2"))
+
+    # reproducible output: object addresses in the captured output are replaced by ordinals (0x000000000001, ...) in the order in which they appear,
+    # the build driver seeds the random module with random_seed, and runs the lesson with PYTHONHASHSEED set to random_seed.
+    # normalize_patterns are the regular expressions for object addresses: hexadecimal ones of nine or more digits, and decimal numbers of ten or more
+    # digits (as shown by id()); a match is replaced only if it is a multiple of eight, as addresses are. mask_timestamps replaces the digits of dates and times with X.
+    # The ordinals depend on the objects allocated by all snippets: with snippets replayed from the cache (cache_dir) or run in the pool (parallel), they can differ.
+    # (defaults are taken from the MDF_NORMALIZE, MDF_RANDOM_SEED and MDF_MASK_TIMESTAMPS environment variables)
+    normalize = _env_flag("MDF_NORMALIZE")
+    random_seed = int(os.environ.get("MDF_RANDOM_SEED", "0"))
+    normalize_patterns = ( r"\b0x[0-9a-f]{9,}\b", r"(?<![\w.])[1-9][0-9]{9,}(?![\w.])" )
+    mask_timestamps = _env_flag("MDF_MASK_TIMESTAMPS")
+
+    # profile_and_quote shows the profile_top functions of the profile, sorted by profile_sort (a pstats sort key).
+    # With profile_dump set, the profile of each snippet is also written to LESSON.LINE.pstats
+    # (defaults are taken from the MDF_PROFILE_TOP, MDF_PROFILE_SORT and MDF_PROFILE_DUMP environment variables)
+    profile_top = int(os.environ.get("MDF_PROFILE_TOP", "15"))
+    profile_sort = os.environ.get("MDF_PROFILE_SORT", "cumulative")
+    profile_dump = _env_flag("MDF_PROFILE_DUMP")
+
+    # timeit_and_quote takes timeit_repeat samples of each variant. With timeit_store set, the results are stored in LESSON.timing.json,
+    # a median that grew by more than timeit_threshold (0.1 is 10%) since the previous build is marked as a regression.
+    # (defaults are taken from the MDF_TIMEIT_REPEAT, MDF_TIMEIT_STORE and MDF_TIMEIT_THRESHOLD environment variables)
+    timeit_repeat = int(os.environ.get("MDF_TIMEIT_REPEAT", "7"))
+    timeit_store = _env_flag("MDF_TIMEIT_STORE")
+    timeit_threshold = float(os.environ.get("MDF_TIMEIT_THRESHOLD", "0.1"))
+
+    # tracemalloc_and_quote shows the tracemalloc_top lines of a snippet by retained memory, tracemalloc_frames is the number of frames that tracemalloc keeps
+    # (so that an allocation inside a called function is attributed to the line of the snippet). It is not used, if tracing is on already (perf_report)
+    # (defaults are taken from the MDF_TRACEMALLOC_TOP and MDF_TRACEMALLOC_FRAMES environment variables)
+    tracemalloc_top = int(os.environ.get("MDF_TRACEMALLOC_TOP", "10"))
+    tracemalloc_frames = int(os.environ.get("MDF_TRACEMALLOC_FRAMES", "25"))
+
+    # keep-going mode: a failing snippet (or a command that fails with exit_on_error set) doesn't stop the lesson. Its error is shown in the document,
+    # and at the end all failures are listed on standard error, and the lesson exits with an error.
+    # (default is taken from the MDF_KEEP_GOING environment variable)
+    keep_going = _env_flag("MDF_KEEP_GOING")
+
+    # count how often each line of the snippets of eval_and_quote runs (with sys.monitoring on python 3.12 and later, else with sys.settrace),
+    # the counts are written to LESSON.coverage.json. With line_heat set, the quoted source of each snippet shows the counts of its lines.
+    # Snippets are not taken from the cache or the process pool, while lines are counted.
+    # (defaults are taken from the MDF_LINE_COUNTS and MDF_LINE_HEAT environment variables)
+    line_counts = _env_flag("MDF_LINE_COUNTS")
+    line_heat = _env_flag("MDF_LINE_HEAT")
+
+    # namespace of the snippets: "shared" (the globals of the lesson), "section" (the snippets of a header_md section share a namespace)
+    # or "snippet" (each snippet runs in its own namespace). Names not bound in the namespace are read from the globals of the lesson, gc.collect() runs between namespaces;
+    # the names listed in the exports argument of eval_and_quote are copied to the globals of the lesson. Results are only cached, and snippets only
+    # run in parallel, with a shared namespace.
+    # (default is taken from the MDF_NAMESPACE environment variable)
+    namespace = os.environ.get("MDF_NAMESPACE", "shared")
+
+    # show the snippets that retained the most memory on standard error at exit, without the rest of the performance report (perf_report shows them too).
+    # This is always on with a namespace other than "shared": the retained memory shows what a section or snippet keeps alive.
+    # (default is taken from the MDF_RETAINED_REPORT environment variable)
+    retained_report = _env_flag("MDF_RETAINED_REPORT")
+
+    # directory of the compiled snippets: the code object of each snippet is kept in a marshal file, named by the hash of its source and of the
+    # bytecode version of python. If None, the __pycache__ directory next to the lesson is used (no directory, if python doesn't write bytecode files)
+    # (default is taken from the MDF_CODE_CACHE_DIR environment variable)
+    code_cache_dir = os.environ.get("MDF_CODE_CACHE_DIR")
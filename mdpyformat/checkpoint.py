@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+
+# Build daemon that keeps copy-on-write checkpoints of a lesson, taken with os.fork after each top level statement that evaluated a snippet.
+# A rebuild of an edited lesson resumes from the last checkpoint that is before the first changed statement, instead of running the lesson from the top.
+#
+#   python3 -m mdpyformat.checkpoint serve                      - run the daemon
+#   python3 -m mdpyformat.checkpoint build LESSON.py [OUT.md]   - build a lesson via the daemon (output goes to standard output, if OUT.md is missing)
+#   python3 -m mdpyformat.checkpoint stats                      - show the checkpoints kept by the daemon, and their memory usage
+#   python3 -m mdpyformat.checkpoint shutdown                   - stop the daemon and all checkpoint processes
+
+import os
+import sys
+import io
+import ast
+import json
+import time
+import uuid
+import socket
+import atexit
+import argparse
+import builtins
+import traceback
+import threading
+import subprocess
+import socketserver
+from .cfg import MdfCfg
+from . import mdf as _mdf
+from . import tocgen
+from . import snipcache as _snipcache
+from . import normalize as _normalize
+from .document import Document, use_document
+
+
+def _send(wfile, msg):
+    wfile.write(json.dumps(msg) + "\n")
+    wfile.flush()
+
+def _receive(rfile):
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+def _connect(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    return sock, sock.makefile("r", encoding="utf-8"), sock.makefile("w", encoding="utf-8")
+
+def prefix_hashes(source):
+    """ returns the statements of a lesson, and for each statement a hash of the lesson source up to the end of that statement """
+    tree = ast.parse(source)
+    lines = source.split("\n")
+    hashes = []
+    digest = ""
+    prev_end = 0
+    for stmt in tree.body:
+        digest = _snipcache.ResultCache.make_key(sys.version, digest, "\n".join(lines[prev_end : stmt.end_lineno]))
+        prev_end = stmt.end_lineno
+        hashes.append(digest)
+    return tree.body, hashes
+
+def checkpoint_memory(pid):
+    """ returns (proportional set size, private dirty memory) of a checkpoint process in bytes, from /proc/pid/smaps_rollup (Linux only) """
+    pss = private = None
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as file:
+            for line in file:
+                fields = line.split()
+                if fields[0] == "Pss:":
+                    pss = int(fields[1]) * 1024
+                elif fields[0] == "Private_Dirty:":
+                    private = int(fields[1]) * 1024
+    except OSError:
+        pass
+    return pss, private
+
+
+#
+# the lesson runner and the checkpoint process
+#
+
+class _RunState:
+    """ what a runner process is doing: running the statements of lesson source from statement start, for the build build_id """
+
+    def __init__(self, lesson, source, start, build_id):
+        self.lesson = lesson
+        self.source = source
+        self.start = start
+        self.build_id = build_id
+
+
+def _run_statements(state, namespace, socket_path):
+    snippets_run = [0]
+    def count_snippet():
+        snippets_run[0] += 1
+    _mdf._after_snippet_hooks.append(count_snippet)
+
+    resumed = True
+    while resumed:
+        stmts, hashes = prefix_hashes(state.source)
+        resumed = False
+        for index in range(state.start, len(stmts)):
+            count_before = snippets_run[0]
+            code = compile(ast.Module(body=[stmts[index]], type_ignores=[]), state.lesson, "exec")
+            exec(code, namespace)
+            if snippets_run[0] != count_before:
+                # if resumed is set: this is a new runner process, forked from a checkpoint, state now refers to the new build.
+                resumed = _take_checkpoint(state, index, hashes[index], socket_path)
+                if resumed:
+                    break
+
+def _exit_copy(status):
+    # a parked checkpoint is a copy of the runner: its exit functions and file buffers are those of the runner, and must not run or be flushed
+    # a second time (that would write the performance report again, or send another result). It leaves without finalization, as the forked
+    # processes of multiprocessing do; there is nothing pending in the copy, as all output was flushed before the fork.
+    os._exit(status)
+
+def _take_checkpoint(state, index, prefix_hash, socket_path):
+    # the runner continues in the parent. The child process parks itself as a checkpoint, until the daemon tells it to resume or to exit.
+    # The commands of run_and_quote that still run in the thread pool are waited for: a forked process has no threads.
+    _mdf._join_concurrent_runs()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if os.fork() != 0:
+        return False
+
+    try:
+        sock, rfile, wfile = _connect(socket_path)
+        _send(wfile, { "cmd" : "park", "lesson" : state.lesson, "index" : index, "prefix" : prefix_hash, "pid" : os.getpid() })
+        while True:
+            msg = _receive(rfile)
+            if msg is None or msg["cmd"] != "resume":
+                _exit_copy(0)
+
+            pid = os.fork()
+            if pid == 0:
+                rfile.close()
+                wfile.close()
+                sock.close()
+                state.source = msg["source"]
+                state.start = msg["start"]
+                state.build_id = msg["build"]
+                return True
+
+            _, status = os.waitpid(pid, 0)
+            _send(wfile, { "cmd" : "runner_exit", "build" : msg["build"], "status" : status })
+    except Exception:
+        _exit_copy(1)
+
+def _run_lesson(lesson, build_id, socket_path):
+    # the runner process: execute the lesson statement by statement, the document and the standard error are collected, and sent to the daemon
+    # when the process exits. The result is sent by an exit function that is registered before the lesson runs: the exit functions registered
+    # by the lesson (performance report, cache statistics) run before it, their output is part of the result.
+    err = io.StringIO()
+    saved_stderr = sys.stderr
+    sys.stderr = err
+    sys.argv = [ lesson ]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(lesson)))
+    document = use_document(Document(normalizer=_normalize.make_normalizer()))
+    _normalize.seed_random()
+
+    state = _RunState(lesson, None, 0, build_id)
+    exit_code = [ 0 ]
+    def send_result():
+        # keep-going mode: the failures are shown, the lesson exits with an error
+        if _mdf._finish_lesson() and exit_code[0] == 0:
+            exit_code[0] = 1
+        sys.stderr = saved_stderr
+        # note: this is a different build, if this process has been forked off a checkpoint
+        _, _, wfile = _connect(socket_path)
+        _send(wfile, { "cmd" : "result", "build" : state.build_id, "output" : document.getvalue(), "stderr" : err.getvalue(), "exit_code" : exit_code[0] })
+    atexit.register(send_result)
+
+    try:
+        with open(lesson, "r", encoding="utf-8") as file:
+            state.source = file.read()
+        namespace = { "__name__" : "__main__", "__file__" : lesson, "__builtins__" : builtins }
+        _run_statements(state, namespace, socket_path)
+    except SystemExit as ex:
+        exit_code[0] = ex.code if isinstance(ex.code, int) else (0 if ex.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        exit_code[0] = 1
+
+
+#
+# the daemon
+#
+
+class _Checkpoint:
+    """ a parked checkpoint process, as seen by the daemon """
+
+    def __init__(self, lesson, index, prefix, pid, wfile):
+        self.lesson = lesson
+        self.index = index
+        self.prefix = prefix
+        self.pid = pid
+        self.wfile = wfile
+        self.last_used = time.time()
+
+
+class _PendingBuild:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+    def finish(self, result):
+        if not self.done.is_set():
+            self.result = result
+            self.done.set()
+
+
+class _Daemon:
+
+    def __init__(self, socket_path, max_checkpoints):
+        self.socket_path = socket_path
+        self.max_checkpoints = max_checkpoints
+        self.lock = threading.Lock()
+        self.checkpoints = []
+        self.pending = {}
+
+    def add_checkpoint(self, checkpoint):
+        with self.lock:
+            # a checkpoint for the same lesson prefix is replaced by the new one.
+            self._evict( list( filter( lambda entry : entry.lesson == checkpoint.lesson and entry.prefix == checkpoint.prefix, self.checkpoints ) ) )
+            self.checkpoints.append(checkpoint)
+            while len(self.checkpoints) > self.max_checkpoints:
+                self._evict( [ self._eviction_victim() ] )
+
+    def _eviction_victim(self):
+        # keep the checkpoints of a lesson spread out over the lesson: evict the one that is closest to the preceding checkpoint of the same lesson
+        # (the first checkpoint of a lesson counts its distance from the start). Ties go to the least recently used one.
+        prev_index = {}
+        victim = None
+        victim_score = None
+        for checkpoint in sorted( self.checkpoints, key=lambda entry : (entry.lesson, entry.index) ):
+            score = (checkpoint.index - prev_index.get(checkpoint.lesson, -1), checkpoint.last_used)
+            prev_index[checkpoint.lesson] = checkpoint.index
+            if victim is None or score < victim_score:
+                victim = checkpoint
+                victim_score = score
+        return victim
+
+    def remove_checkpoint(self, checkpoint):
+        with self.lock:
+            if checkpoint in self.checkpoints:
+                self.checkpoints.remove(checkpoint)
+
+    def _evict(self, to_evict):
+        for checkpoint in to_evict:
+            if checkpoint in self.checkpoints:
+                self.checkpoints.remove(checkpoint)
+            try:
+                _send(checkpoint.wfile, { "cmd" : "exit" })
+            except (OSError, ValueError):
+                pass
+
+    def build(self, lesson, source, cwd):
+        """ run the lesson, resuming from the best checkpoint there is. Returns the result message of the runner """
+        try:
+            _, hashes = prefix_hashes(source)
+        except SyntaxError:
+            hashes = []
+
+        build_id = uuid.uuid4().hex
+        pending = _PendingBuild()
+        with self.lock:
+            self.pending[build_id] = pending
+
+            # checkpoints of the lesson that are not on the path of the current source will never be used again.
+            valid = set(hashes)
+            self._evict( list( filter( lambda entry : entry.lesson == lesson and entry.prefix not in valid, self.checkpoints ) ) )
+
+            best = None
+            for checkpoint in self.checkpoints:
+                if checkpoint.lesson == lesson and (best is None or checkpoint.index > best.index):
+                    best = checkpoint
+            if best is not None:
+                best.last_used = time.time()
+                try:
+                    _send(best.wfile, { "cmd" : "resume", "build" : build_id, "source" : source, "start" : best.index + 1 })
+                except (OSError, ValueError):
+                    self.checkpoints.remove(best)
+                    best = None
+
+        start_time = time.time()
+        proc = None
+        if best is None:
+            # the runner must find this mdpyformat package, whatever the working directory of the client is.
+            env = dict(os.environ)
+            package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            env["PYTHONPATH"] = os.pathsep.join( filter( None, [ package_dir, env.get("PYTHONPATH") ] ) )
+            if _normalize.needs_hash_seed(env):
+                env["PYTHONHASHSEED"] = str(MdfCfg.random_seed)
+            proc = subprocess.Popen([ sys.executable, "-m", "mdpyformat.checkpoint", "run", lesson, build_id, self.socket_path ], cwd=cwd, env=env)
+        while not pending.done.wait(0.1):
+            # a runner that exits normally has sent its result before that.
+            if proc is not None and proc.poll() is not None and proc.returncode != 0:
+                pending.finish({ "output" : "", "stderr" : f"runner process failed with status {proc.returncode}\n", "exit_code" : 1 })
+        if proc is not None:
+            proc.wait()
+
+        with self.lock:
+            del self.pending[build_id]
+        result = pending.result
+        result["resumed_after"] = best.index if best is not None else None
+        result["build_time"] = time.time() - start_time
+        return result
+
+    def finish_build(self, build_id, result):
+        with self.lock:
+            pending = self.pending.get(build_id)
+        if pending is not None:
+            pending.finish(result)
+
+    def stats(self):
+        with self.lock:
+            checkpoints = list(self.checkpoints)
+        result = []
+        for checkpoint in checkpoints:
+            pss, private = checkpoint_memory(checkpoint.pid)
+            result.append({ "lesson" : checkpoint.lesson, "index" : checkpoint.index, "pid" : checkpoint.pid, "pss" : pss, "private" : private })
+        return result
+
+    def shutdown(self):
+        with self.lock:
+            self._evict(list(self.checkpoints))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        rfile = io.TextIOWrapper(self.rfile, encoding="utf-8")
+        wfile = io.TextIOWrapper(self.wfile, encoding="utf-8")
+        daemon = self.server.daemon
+        msg = _receive(rfile)
+        if msg is None:
+            return
+        cmd = msg["cmd"]
+
+        if cmd == "park":
+            checkpoint = _Checkpoint(msg["lesson"], msg["index"], msg["prefix"], msg["pid"], wfile)
+            daemon.add_checkpoint(checkpoint)
+            # stay connected to the checkpoint, until it exits.
+            while True:
+                msg = _receive(rfile)
+                if msg is None:
+                    break
+                if msg["cmd"] == "runner_exit" and msg["status"] != 0:
+                    daemon.finish_build(msg["build"], { "output" : "", "stderr" : f"runner process failed with status {msg['status']}\n", "exit_code" : 1 })
+            daemon.remove_checkpoint(checkpoint)
+        elif cmd == "result":
+            daemon.finish_build(msg["build"], msg)
+        elif cmd == "build":
+            _send(wfile, daemon.build(msg["lesson"], msg["source"], msg["cwd"]))
+        elif cmd == "stats":
+            _send(wfile, { "checkpoints" : daemon.stats() })
+        elif cmd == "shutdown":
+            daemon.shutdown()
+            _send(wfile, { "ok" : True })
+            threading.Thread(target=self.server.shutdown).start()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path, max_checkpoints):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with _Server(socket_path, _Handler) as server:
+        server.daemon = _Daemon(socket_path, max_checkpoints)
+        print(f"checkpoint daemon listening on {socket_path}, keeps up to {max_checkpoints} checkpoints", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            server.daemon.shutdown()
+            os.unlink(socket_path)
+
+
+#
+# client commands
+#
+
+def _format_bytes(num):
+    return "n/a" if num is None else f"{num / (1024 * 1024):.1f} MiB"
+
+def _request(socket_path, msg):
+    try:
+        sock, rfile, wfile = _connect(socket_path)
+    except OSError as err:
+        print(f"Error: can't connect to the checkpoint daemon at {socket_path} ({err}), start it with: python3 -m mdpyformat.checkpoint serve", file=sys.stderr)
+        sys.exit(1)
+    with sock:
+        _send(wfile, msg)
+        return _receive(rfile)
+
+def show_stats(socket_path):
+    checkpoints = _request(socket_path, { "cmd" : "stats" })["checkpoints"]
+    total_pss = total_private = 0
+    for entry in checkpoints:
+        print(f"{entry['lesson']} statement: {entry['index']} pid: {entry['pid']} pss: {_format_bytes(entry['pss'])} private: {_format_bytes(entry['private'])}", file=sys.stderr)
+        total_pss += entry["pss"] or 0
+        total_private += entry["private"] or 0
+    print(f"{len(checkpoints)} checkpoints, pss: {_format_bytes(total_pss)} private: {_format_bytes(total_private)}", file=sys.stderr)
+
+def build(socket_path, lesson, out_file):
+    lesson = os.path.abspath(lesson)
+    with open(lesson, "r", encoding="utf-8") as file:
+        source = file.read()
+    result = _request(socket_path, { "cmd" : "build", "lesson" : lesson, "source" : source, "cwd" : os.getcwd() })
+
+    sys.stderr.write(result["stderr"])
+    # as python3 -m mdpyformat.build: the table of contents is added, the output file is not written if the lesson fails (except in keep-going mode)
+    if result["exit_code"] == 0 or MdfCfg.keep_going:
+        tocgen.processFile(io.StringIO(result["output"]), out_file if out_file is not None else sys.stdout)
+
+    resumed = result["resumed_after"]
+    resumed_msg = "from the top" if resumed is None else f"from checkpoint after statement {resumed}"
+    print(f"{lesson}: built {resumed_msg} in {result['build_time']:.3f} sec", file=sys.stderr)
+    show_stats(socket_path)
+    return result["exit_code"]
+
+
+def _parse_cmd_line():
+    parser = argparse.ArgumentParser(description="build daemon that resumes lessons from fork based checkpoints")
+    parser.add_argument("--socket", default=MdfCfg.checkpoint_socket, help="unix domain socket of the daemon")
+    subparsers = parser.add_subparsers(dest="cmd", required=True)
+
+    serve_cmd = subparsers.add_parser("serve", help="run the daemon")
+    serve_cmd.add_argument("--max-checkpoints", type=int, default=MdfCfg.max_checkpoints, help="maximum number of checkpoint processes")
+
+    build_cmd = subparsers.add_parser("build", help="build a lesson")
+    build_cmd.add_argument("lesson")
+    build_cmd.add_argument("out_file", nargs="?")
+
+    subparsers.add_parser("stats", help="show checkpoints and their memory usage")
+    subparsers.add_parser("shutdown", help="stop the daemon")
+
+    # internal: the runner process started by the daemon
+    run_cmd = subparsers.add_parser("run")
+    run_cmd.add_argument("lesson")
+    run_cmd.add_argument("build_id")
+    run_cmd.add_argument("daemon_socket")
+
+    return parser.parse_args()
+
+def main():
+    args = _parse_cmd_line()
+    if args.cmd == "serve":
+        serve(args.socket, args.max_checkpoints)
+    elif args.cmd == "build":
+        sys.exit(build(args.socket, args.lesson, args.out_file))
+    elif args.cmd == "stats":
+        show_stats(args.socket)
+    elif args.cmd == "shutdown":
+        _request(args.socket, { "cmd" : "shutdown" })
+    elif args.cmd == "run":
+        _run_lesson(args.lesson, args.build_id, args.daemon_socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# cache of the compiled snippets of eval_and_quote, like the __pycache__ directory of python modules.
+#
+# An entry is the marshal dump of the code object of a snippet, in a file named by the hash of the bytecode version of the interpreter
+# (importlib.util.MAGIC_NUMBER), of the compile flags and of the source. The file starts with the magic number, an entry written by
+# another version of python is never loaded. The snippets of a lesson can be compiled into the cache before the lesson runs (see precompile.py)
+
+import os
+import sys
+import time
+import marshal
+import hashlib
+import importlib.util
+from . import eventloop as _eventloop
+from . import snipdeps as _snipdeps
+from .snipcache import CacheStats
+
+_MAGIC = importlib.util.MAGIC_NUMBER
+
+# subdirectory of __pycache__ that holds the compiled snippets
+_CACHE_SUBDIR = "mdf-snippets"
+
+
+class CodeCache:
+    """ compiled snippets by source, in memory and in the directory cache_dir (in memory only, if cache_dir is None) """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.codes = {}
+        self.stats = CacheStats("compiled snippets")
+
+    def compile(self, source):
+        """ returns the code object of the snippet, a syntax error is raised as by eventloop.compile_snippet """
+        code = self.codes.get(source)
+        if code is not None:
+            return code
+        path = self._path(source)
+        code = self._load(path) if path is not None else None
+        if code is None:
+            code = _eventloop.compile_snippet(source)
+            if path is not None:
+                self._store(path, code)
+        self.codes[source] = code
+        return code
+
+    def _load(self, path):
+        start = time.perf_counter()
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            if not data.startswith(_MAGIC):
+                raise ValueError("bytecode of another python version")
+            code = marshal.loads(data[ len(_MAGIC) : ])
+        except (OSError, ValueError, EOFError, TypeError):
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        self.stats.hit_time += time.perf_counter() - start
+        return code
+
+    def _store(self, path, code):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as file:
+                file.write(_MAGIC + marshal.dumps(code))
+            os.replace(tmp_path, path)
+        except OSError as err:
+            # read-only directory: the snippets of this run are kept in memory only
+            print(f"{self.stats.name}: can't write cache entry {path}: {err}", file=sys.stderr)
+            self.cache_dir = None
+
+    def _path(self, source):
+        if self.cache_dir is None:
+            return None
+        digest = hashlib.sha256(_MAGIC)
+        digest.update(str(_eventloop.COMPILE_FLAGS).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return os.path.join(self.cache_dir, f"{digest.hexdigest()}.{sys.implementation.cache_tag}.pyc")
+
+
+def default_dir(lesson):
+    """ the directory of the compiled snippets of a lesson: in the __pycache__ directory next to it (or below sys.pycache_prefix, as for modules).
+        None if python doesn't write bytecode files (python -B, PYTHONDONTWRITEBYTECODE) """
+    if lesson is None or sys.dont_write_bytecode or sys.implementation.cache_tag is None:
+        return None
+    lesson_dir = os.path.dirname(os.path.abspath(lesson))
+    if sys.pycache_prefix:
+        return os.path.join(sys.pycache_prefix, os.path.splitdrive(lesson_dir)[1].lstrip(os.sep), _CACHE_SUBDIR)
+    return os.path.join(lesson_dir, "__pycache__", _CACHE_SUBDIR)
+
+
+_caches = {}
+
+def get_cache(cache_dir):
+    """ returns the cache instance for the given directory (None: in memory only) """
+    cache_key = os.path.abspath(cache_dir) if cache_dir is not None else None
+    cache = _caches.get(cache_key)
+    if cache is None:
+        cache = CodeCache(cache_dir)
+        _caches[cache_key] = cache
+    return cache
+
+
+def precompile(lesson, cache, func_names=_snipdeps.SNIPPET_FUNCTIONS):
+    """ compile the snippets of the lesson file into the cache: the string literals passed to top level calls of func_names, found with the ast module
+        without running the lesson. Returns the syntax errors as (line in the lesson, message) """
+    errors = []
+    for snippet in filter( None, _snipdeps.lesson_snippets(lesson, func_names) or [] ):
+        try:
+            cache.compile(snippet.source)
+        except SyntaxError as err:
+            errors.append( (snippet.lineno + (err.lineno or 1) - 1, err.msg) )
+    return errors
+
@@ -0,0 +1,188 @@
+import io
+import sys
+import atexit
+from . import normalize as _normalize
+from . import capture as _capture
+
+# the fragments of a document are written to its targets, once they add up to this number of characters
+DEFAULT_FLUSH_SIZE = 256 * 1024
+
+
+class Placeholder:
+    """ a part of a document, its text is filled in later. The document is not written to its targets beyond a placeholder that is not filled yet.
+        resolve is called when the document needs the text of the placeholder (on getvalue and close), it is expected to fill the placeholder """
+
+    def __init__(self, resolve=None):
+        # the fragments of the text, None until the placeholder is filled
+        self.fragments = None
+        self.resolve = resolve
+
+    def is_filled(self):
+        return self.fragments is not None
+
+    @property
+    def text(self):
+        return "".join(self.fragments) if self.fragments is not None else None
+
+
+def _fragment_text(fragment):
+    return fragment.text if isinstance(fragment, Placeholder) else fragment
+
+class Document:
+    """ collects the rendered markdown text as a list of fragments, and writes them in large chunks to all of its targets.
+        A target is a file name (the file is created), or an object with a write method (stream, StringIO).
+        A document without targets keeps all text in memory, getvalue() returns it.
+        normalizer is applied to the captured output of the snippets and commands (fragments of type capture.OutputText), in document order,
+        when the text is written (see normalize.Normalizer) """
+
+    def __init__(self, *targets, flush_size=DEFAULT_FLUSH_SIZE, normalizer=None):
+        self.flush_size = flush_size
+        self.normalizer = normalizer
+        self.fragments = []
+        self.size = 0
+        self.targets = []
+        self.owned_files = []
+        for target in targets:
+            self.add_target(target)
+
+    def add_target(self, target):
+        if isinstance(target, str):
+            target = open(target, "w", encoding="utf-8")
+            self.owned_files.append(target)
+        self.targets.append(target)
+
+    def write(self, text):
+        self.fragments.append(text)
+        self.size += len(text)
+        if self.targets and self.size >= self.flush_size:
+            self.flush()
+        return len(text)
+
+    def add_placeholder(self, resolve=None):
+        """ add a placeholder at the current end of the document, returns the Placeholder """
+        placeholder = Placeholder(resolve)
+        self.fragments.append(placeholder)
+        return placeholder
+
+    def fill(self, placeholder, *fragments):
+        placeholder.fragments = list(fragments)
+        self.size += len(placeholder.text)
+        if self.targets and self.size >= self.flush_size:
+            self.flush()
+
+    def truncate_after(self, placeholder):
+        """ remove everything that was added after the placeholder """
+        if placeholder in self.fragments:
+            del self.fragments[ self.fragments.index(placeholder) + 1 : ]
+            self.size = sum( map( lambda fragment : len(_fragment_text(fragment) or ""), self.fragments ) )
+
+    def resolve_placeholders(self):
+        """ fill all placeholders of the document, by calling their resolve function """
+        while True:
+            unfilled = next( filter( lambda fragment : isinstance(fragment, Placeholder) and not fragment.is_filled(), self.fragments ), None )
+            if unfilled is None:
+                return
+            if unfilled.resolve is not None:
+                unfilled.resolve()
+            if not unfilled.is_filled():
+                self.fill(unfilled, "")
+
+    def _resolve_at_end(self):
+        try:
+            self.resolve_placeholders()
+        except SystemExit:
+            # a placeholder stopped the document, it has been truncated.
+            pass
+
+    def flush(self):
+        if not self.targets or not self.fragments:
+            return
+        # text up to the first placeholder that is not filled yet
+        count = 0
+        for fragment in self.fragments:
+            if isinstance(fragment, Placeholder) and not fragment.is_filled():
+                break
+            count += 1
+        if count == 0:
+            return
+        text = "".join( map( self._normalized_text, self.fragments[ : count ] ) )
+        del self.fragments[ : count ]
+        self.size = sum( map( lambda fragment : len(_fragment_text(fragment) or ""), self.fragments ) )
+        for target in self.targets:
+            target.write(text)
+            target.flush()
+
+    def getvalue(self):
+        """ the text of a document that has no targets """
+        self._resolve_at_end()
+        return "".join( map( self._normalized_text, self.fragments ) )
+
+    def _normalized_text(self, fragment):
+        if isinstance(fragment, Placeholder):
+            return "".join( map( self._normalized_text, fragment.fragments ) )
+        if self.normalizer is not None and isinstance(fragment, _capture.OutputText):
+            return self.normalizer(fragment)
+        return fragment
+
+    def close(self):
+        self._resolve_at_end()
+        self.flush()
+        for file in self.owned_files:
+            file.close()
+        self.owned_files = []
+
+
+class _DocumentStream(io.TextIOBase):
+    """ stands in for sys.stdout while a document is in use, so that the output of print() goes to the document, in order """
+
+    def __init__(self, document):
+        super().__init__()
+        self.document = document
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        return self.document.write(text)
+
+    def flush(self):
+        self.document.flush()
+
+
+_document = None
+_saved_stdout = None
+
+def use_document(document):
+    """ make document the current document: mdf functions and print() write to it, until the document is released """
+    global _document, _saved_stdout
+    release_document()
+    _document = document
+    _saved_stdout = sys.stdout
+    sys.stdout = _DocumentStream(document)
+    return document
+
+def release_document():
+    """ close the current document, and restore sys.stdout """
+    global _document, _saved_stdout
+    if _document is not None:
+        if isinstance(sys.stdout, _DocumentStream) and sys.stdout.document is _document:
+            sys.stdout = _saved_stdout
+        _document.close()
+        _document = None
+        _saved_stdout = None
+
+def current_document():
+    """ returns the current document, if sys.stdout writes to it (and not to the capture of a snippet), else None """
+    stdout = _capture.resolve(sys.stdout)
+    if isinstance(stdout, _DocumentStream) and stdout.document is _document:
+        return _document
+    return None
+
+def get_document():
+    """ returns the current document. The default document writes to standard output as the text arrives, as print() does:
+        a lesson that is run directly shows its progress. The build driver uses a document of its own, that keeps the text in memory """
+    if _document is None:
+        use_document(Document(sys.stdout, flush_size=0, normalizer=_normalize.make_normalizer()))
+    return _document
+
+atexit.register(release_document)
@@ -0,0 +1,114 @@
+import os
+import ast
+import asyncio
+import inspect
+import atexit
+import selectors
+
+# snippets may use await at the top level, these snippets compile to a coroutine.
+COMPILE_FLAGS = ast.PyCF_ALLOW_TOP_LEVEL_AWAIT
+
+_ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+_LOOP_FILES = ( __file__, selectors.__file__ )
+
+
+def compile_snippet(arg_str):
+    return compile(arg_str, "<string>", "exec", flags=COMPILE_FLAGS)
+
+def is_async(code):
+    """ true if the compiled snippet uses top level await, evaluating it returns a coroutine """
+    return bool(code.co_flags & inspect.CO_COROUTINE)
+
+def is_loop_frame(filename):
+    """ true for the frames of the event loop, and of the functions that drive a snippet """
+    return filename in _LOOP_FILES or filename.startswith(_ASYNCIO_DIR)
+
+
+# the event loop of each lesson module, by id of the globals of the lesson. The loop stays open while the lesson is running.
+_event_loops = {}
+# loops inherited from the parent process after a fork, these are never run or closed: the selector is shared with the parent.
+_inherited_loops = []
+
+def get_event_loop(globals_dict):
+    loop = _event_loops.get(id(globals_dict))
+    if loop is None:
+        loop = asyncio.new_event_loop()
+        _event_loops[id(globals_dict)] = loop
+    return loop
+
+def close_event_loop(globals_dict):
+    loop = _event_loops.pop(id(globals_dict), None)
+    if loop is not None:
+        _close(loop)
+
+def _close(loop):
+    try:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    finally:
+        loop.close()
+
+def _close_all():
+    for loop in list(_event_loops.values()):
+        _close(loop)
+    _event_loops.clear()
+
+def _forget_loops():
+    _inherited_loops.extend(_event_loops.values())
+    _event_loops.clear()
+
+atexit.register(_close_all)
+os.register_at_fork(after_in_child=_forget_loops)
+
+
+def run(globals_dict, coro):
+    """ run the coroutine of a snippet on the event loop of the lesson, until it is done """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("an event loop is already running in this thread, use: await eval_and_quote_async(...)")
+
+    loop = get_event_loop(globals_dict)
+    task = loop.create_task(coro)
+    try:
+        return loop.run_until_complete(task)
+    finally:
+        # a snippet interrupted by a limit leaves its task behind, it is cancelled when the loop runs again.
+        task.cancel()
+
+
+def drive(steps, globals_dict):
+    """ run a generator that evaluates snippets: each coroutine yielded by the generator is run on the event loop of the lesson,
+        its result (or exception) is sent back into the generator. Returns the return value of the generator """
+    value = error = None
+    while True:
+        try:
+            coro = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value = error = None
+        try:
+            value = run(globals_dict, coro)
+        except BaseException as ex:
+            error = ex
+
+async def drive_async(steps):
+    """ as drive, but the coroutines are awaited in the event loop that is running the caller """
+    value = error = None
+    while True:
+        try:
+            coro = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value = error = None
+        try:
+            value = await coro
+        except BaseException as ex:
+            error = ex
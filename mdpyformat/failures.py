@@ -0,0 +1,48 @@
+import os
+import sys
+import threading
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Failure:
+    """ a snippet or command that failed, in keep-going mode """
+
+    def __init__(self, kind, location, message):
+        self.kind = kind
+        self.location = location
+        self.message = message
+
+
+class FailureLog:
+    """ the failures of a lesson in keep-going mode: the lesson goes on after a failure, the failures are listed at the end """
+
+    def __init__(self):
+        self.failures = []
+        self.lock = threading.Lock()
+
+    def add(self, kind, message, location=None):
+        if location is None:
+            location = lesson_location()
+        with self.lock:
+            self.failures.append(Failure(kind, location, message))
+
+    def report(self, file):
+        """ show a summary of the failures, returns True if there are any """
+        if not self.failures:
+            return False
+        print(f"{len(self.failures)} failures:", file=file)
+        for failure in self.failures:
+            print(f"  {failure.location}: {failure.kind}: {failure.message}", file=file)
+        return True
+
+
+def lesson_location(frame=None):
+    """ file:line of the innermost frame of the calling thread that is not part of mdpyformat (the line of the lesson that called it) """
+    if frame is None:
+        frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.startswith(_PACKAGE_DIR):
+        frame = frame.f_back
+    if frame is None:
+        return "<unknown>"
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
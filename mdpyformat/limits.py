@@ -0,0 +1,151 @@
+import os
+import shlex
+import signal
+import threading
+import subprocess
+import contextlib
+from . import capture as _capture
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class SnippetLimitExceeded(BaseException):
+    """ raised inside a snippet that exceeds its wall time or cpu time limit.
+        Derived from BaseException, so that an 'except Exception' clause in the snippet won't stop it """
+
+
+class Limits:
+    """ resource limits for a snippet or a command: wall time (seconds), cpu time (seconds), memory (bytes).
+        None means: no limit """
+
+    def __init__(self, timeout=None, cpu_time=None, memory=None):
+        self.timeout = timeout
+        self.cpu_time = cpu_time
+        self.memory = memory
+
+    def is_set(self):
+        return self.timeout is not None or self.cpu_time is not None or self.memory is not None
+
+    def override(self, timeout=None, cpu_time=None, memory=None):
+        """ returns the limits with the arguments that are not None replacing the current values """
+        return Limits(timeout if timeout is not None else self.timeout,
+                      cpu_time if cpu_time is not None else self.cpu_time,
+                      memory if memory is not None else self.memory)
+
+
+# a timer that fired, but didn't stop the snippet, fires again after this number of seconds.
+_REPEAT_INTERVAL = 0.5
+
+def _address_space_used():
+    # current size of the address space of this process (Linux only)
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+@contextlib.contextmanager
+def _timer(which, signum, seconds, message):
+    def on_timer(_signum, _frame):
+        raise SnippetLimitExceeded(message)
+    old_handler = signal.signal(signum, on_timer)
+    signal.setitimer(which, seconds, _REPEAT_INTERVAL)
+    try:
+        yield
+    finally:
+        # the timer repeats, it may fire again before it is stopped: once the signal is ignored, the handler can't raise here anymore.
+        while True:
+            try:
+                signal.signal(signum, signal.SIG_IGN)
+                break
+            except SnippetLimitExceeded:
+                pass
+        signal.setitimer(which, 0)
+        signal.signal(signum, old_handler)
+
+@contextlib.contextmanager
+def _address_space_limit(memory):
+    used = _address_space_used()
+    if used is None:
+        yield
+        return
+    old_limit = resource.getrlimit(resource.RLIMIT_AS)
+    new_soft = used + memory
+    if old_limit[1] != resource.RLIM_INFINITY:
+        new_soft = min(new_soft, old_limit[1])
+    resource.setrlimit(resource.RLIMIT_AS, (new_soft, old_limit[1]))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, old_limit)
+
+@contextlib.contextmanager
+def in_process_limits(limits):
+    """ apply the limits to code that runs in this process: SnippetLimitExceeded is raised on timeout, MemoryError if the snippet allocates more than limits.memory bytes.
+        Time limits only work in the main thread of a posix system, the memory limit only on Linux. """
+    with contextlib.ExitStack() as stack:
+        can_signal = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+        if limits.timeout is not None and can_signal:
+            stack.enter_context(_timer(signal.ITIMER_REAL, signal.SIGALRM, limits.timeout, f"wall time limit of {limits.timeout} seconds exceeded"))
+        if limits.cpu_time is not None and can_signal:
+            stack.enter_context(_timer(signal.ITIMER_PROF, signal.SIGPROF, limits.cpu_time, f"cpu time limit of {limits.cpu_time} seconds exceeded"))
+        if limits.memory is not None and resource is not None:
+            stack.enter_context(_address_space_limit(limits.memory))
+        yield
+
+
+def _set_child_limits(limits):
+    # runs in the child process, before exec
+    if limits.cpu_time is not None:
+        cpu_time = int(limits.cpu_time + 0.999)
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 1))
+    if limits.memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (limits.memory, limits.memory))
+
+def run_command(cmd_str, limits, output, max_bytes=None):
+    """ run the command with the limits (cpu time and memory of the child are limited with setrlimit, the address space limit is for the whole child process)
+        Standard error is merged into standard output, the output is written to output as it arrives (see capture.copy_chunks for max_bytes).
+        returns (exit_code, error message or None) """
+    preexec_fn = None
+    if resource is not None and (limits.cpu_time is not None or limits.memory is not None):
+        preexec_fn = lambda : _set_child_limits(limits)
+
+    args = shlex.split(cmd_str)
+    try:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, preexec_fn=preexec_fn)
+    except FileNotFoundError:
+        # the exit codes of a shell
+        return 127, f"command not found: {args[0]}"
+    except PermissionError:
+        return 126, f"permission denied: {args[0]}"
+
+    with process:
+        timed_out = threading.Event()
+        timer = None
+        if limits.timeout is not None:
+            def on_timeout():
+                timed_out.set()
+                process.kill()
+            timer = threading.Timer(limits.timeout, on_timeout)
+            timer.start()
+        try:
+            dropped = _capture.copy_chunks(process.stdout.read1, output, max_bytes)
+            exit_code = process.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+    if dropped:
+        output.write("\n" + _capture.cut_off_marker(dropped) + "\n")
+
+    error = None
+    if timed_out.is_set():
+        error = f"wall time limit of {limits.timeout} seconds exceeded"
+    elif exit_code < 0:
+        if exit_code in (-signal.SIGXCPU, -signal.SIGKILL) and limits.cpu_time is not None:
+            error = f"killed by signal {-exit_code}, cpu time limit of {limits.cpu_time} seconds exceeded"
+        else:
+            error = f"killed by signal {-exit_code}"
+    return exit_code, error
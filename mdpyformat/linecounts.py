@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import atexit
+import collections
+
+# sys.monitoring (python 3.12 and later) only reports the lines of the code objects of the snippet, other code runs at full speed.
+# Without it, sys.settrace is used.
+_monitoring = getattr(sys, "monitoring", None)
+_TOOL_NAME = "mdpyformat"
+
+# a line of the heat annotation shows a bar of up to this number of characters
+_BAR_WIDTH = 8
+
+
+def _code_objects(code):
+    # the code of the snippet, and of all functions, classes and comprehensions defined in it
+    result = { code }
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            result |= _code_objects(const)
+    return result
+
+
+class LineCounter:
+    """ counts how often each line of a snippet runs. Calling the counter with the compiled snippet returns the counter,
+        as a context manager it counts the lines while the snippet is running (see the instrument argument of mdf._eval_snippet_steps) """
+
+    def __init__(self):
+        self.code = None
+        self.codes = set()
+        self.counts = collections.Counter()
+        self.tool_id = None
+        self.old_trace = None
+
+    def __call__(self, code):
+        self.code = code
+        self.codes = _code_objects(code)
+        return self
+
+    def __enter__(self):
+        if _monitoring is not None:
+            self.tool_id = _free_tool_id()
+        if self.tool_id is not None:
+            _monitoring.use_tool_id(self.tool_id, _TOOL_NAME)
+            _monitoring.register_callback(self.tool_id, _monitoring.events.LINE, self._on_line)
+            for code in self.codes:
+                _monitoring.set_local_events(self.tool_id, code, _monitoring.events.LINE)
+        else:
+            self.old_trace = sys.gettrace()
+            sys.settrace(self._trace)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.tool_id is not None:
+            for code in self.codes:
+                _monitoring.set_local_events(self.tool_id, code, 0)
+            _monitoring.register_callback(self.tool_id, _monitoring.events.LINE, None)
+            _monitoring.free_tool_id(self.tool_id)
+            self.tool_id = None
+        else:
+            sys.settrace(self.old_trace)
+        return False
+
+    def _on_line(self, code, line_number):
+        self.counts[line_number] += 1
+
+    def _trace(self, frame, event, _arg):
+        # global trace function: only the frames of the snippet are traced line by line
+        if frame.f_code not in self.codes:
+            return None
+        if event == "line":
+            self.counts[frame.f_lineno] += 1
+        return self._trace
+
+    def executable_lines(self, arg_str):
+        """ the line numbers of the snippet that have code (the start of a coroutine is reported at the first line, even if it is empty) """
+        code_lines = arg_str.split("\n")
+        lines = set()
+        for code in self.codes:
+            lines.update( map( lambda entry : entry[2], code.co_lines() ) )
+        return set( filter( lambda line : line is not None and 0 < line <= len(code_lines) and code_lines[line - 1].strip() != "", lines ) )
+
+    def annotate(self, arg_str):
+        """ the source of the snippet as a markdown code block, each line shows its count and a bar (the longest bar for the line that ran most often).
+            Lines without code show no count, lines with code that didn't run show 0 """
+        executable = self.executable_lines(arg_str)
+        top = max(self.counts.values(), default=0)
+        lines = []
+        for line_number, line in enumerate(arg_str.split("\n"), 1):
+            count = self.counts.get(line_number, 0)
+            if line_number not in executable and count == 0:
+                lines.append(f"{'':>8} {'':{_BAR_WIDTH}} | {line}")
+                continue
+            bar = "#" * max(1, round(_BAR_WIDTH * count / top)) if count else ""
+            lines.append(f"{count:>8} {bar:{_BAR_WIDTH}} | {line}")
+        return "```\n" + "\n".join(lines) + "\n```\n"
+
+
+def _free_tool_id():
+    # the coverage tool id, unless a coverage tool (like coverage.py) is using it; then the optimizer id, else none.
+    for tool_id in (_monitoring.COVERAGE_ID, _monitoring.OPTIMIZER_ID):
+        if _monitoring.get_tool(tool_id) is None:
+            return tool_id
+    return None
+
+
+class CoverageReport:
+    """ line counts of the snippets of a lesson, written to LESSON.coverage.json at exit """
+
+    def __init__(self, lesson):
+        self.path = os.path.splitext(lesson)[0] + ".coverage.json"
+        self.snippets = []
+        atexit.register(self.save)
+
+    def add(self, line, arg_str, counter):
+        executable = counter.executable_lines(arg_str)
+        self.snippets.append({ "line" : line,
+                               "source" : arg_str,
+                               "counts" : dict( map( lambda item : (str(item[0]), item[1]), sorted(counter.counts.items()) ) ),
+                               "missed" : sorted( filter( lambda line_number : line_number not in counter.counts, executable ) ) })
+
+    def save(self):
+        try:
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump(self.snippets, file, indent=2)
+        except OSError as err:
+            print(f"can't write {self.path}: {err}", file=sys.stderr)
+
+
+_reports = {}
+
+def get_report(lesson):
+    report = _reports.get(lesson)
+    if report is None:
+        report = CoverageReport(lesson)
+        _reports[lesson] = report
+    return report
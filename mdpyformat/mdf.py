@@ -1,14 +1,123 @@
+import os
 import sys
 import re
+import gc
+import shlex
+import shutil
+import fnmatch
+import atexit
+import time
+import concurrent.futures
 from io import StringIO
 import inspect
 import traceback
 import contextlib
-import subb
+
+# the names that a lesson gets with: from mdpyformat import *
+__all__ = [ "header_md", "print_md", "print_quoted", "print_quoted_pre", "print_code", "run_and_quote", "eval_and_quote", "eval_and_quote_async",
+            "profile_and_quote", "timeit_and_quote", "tracemalloc_and_quote", "finish_lesson", "MdfCfg", "Document", "use_document", "release_document" ]
+
+# set at exit, if there were failures in keep-going mode (see _finish_lesson_at_exit)
+_lesson_failed = False
+
+def _exit_on_failure():
+    # an exit function can't change the exit status with sys.exit. This one is registered before the other exit functions of mdpyformat,
+    # so it runs last: after a failure in keep-going mode, it flushes the output and ends the process with status 1.
+    if not _lesson_failed:
+        return
+    if "logging" in sys.modules:
+        sys.modules["logging"].shutdown()
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+    os._exit(1)
+
+atexit.register(_exit_on_failure)
+
+from .cfg import MdfCfg
+from .version import VERSION
+from . import snipcache as _snipcache
+from . import snipdeps as _snipdeps
+from . import parallel as _parallel
+from . import perfstats as _perfstats
+from . import limits as _limits
+from . import capture as _capture
+from . import document as _document
+from . import eventloop as _eventloop
+from . import warmpool as _warmpool
+from . import profiling as _profiling
+from . import timing as _timing
+from . import allocations as _allocations
+from . import failures as _failures
+from . import linecounts as _linecounts
+from . import codecache as _codecache
+from . import normalize as _normalize
+from .document import Document, use_document, release_document, get_document
+
+
+# the last header shown by header_md, the performance report refers to it
+_current_section = ""
+
+# top level calls of these functions in a lesson are snippets (see snipdeps.lesson_snippets)
+_SNIPPET_FUNCTIONS = _snipdeps.SNIPPET_FUNCTIONS
+
+# failures of snippets and commands in keep-going mode
+_failure_log = _failures.FailureLog()
+
+def _join_concurrent_runs():
+    # wait for the commands of run_and_quote that are still running, and stop the thread pool; the next command starts a new one.
+    # Exits if one of the commands failed with exit_on_error set.
+    global _concurrent_runs
+    if _concurrent_runs is not None:
+        runs = _concurrent_runs
+        _concurrent_runs = None
+        if runs.finish():
+            sys.exit(1)
+
+def _finish_lesson():
+    # at exit, or when the build driver is done with the lesson: once the remaining commands are done, show the summary of the failures
+    # of keep-going mode. Returns True if the lesson failed.
+    global _failure_log, _concurrent_runs
+    failed = False
+    if _concurrent_runs is not None:
+        failed = _concurrent_runs.finish()
+        _concurrent_runs = None
+    # the summary comes after the end of the document: on a terminal, both are shown on the same screen
+    release_document()
+    failed = _failure_log.report(sys.stderr) or failed
+    _failure_log = _failures.FailureLog()
+    return failed
+
+def finish_lesson():
+    """ call at the end of a lesson that is run directly (./LESSON.py): waits for the commands of run_and_quote, shows the failures
+        of keep-going mode, and exits with an error status if there were any. This is done at exit anyway, and by the build driver (python3 -m mdpyformat.build) """
+    if _finish_lesson():
+        sys.exit(1)
+
+def _finish_lesson_at_exit():
+    global _lesson_failed
+    if _finish_lesson():
+        _lesson_failed = True
+
+# registered after the exit function that closes the document (exit functions run in reverse order): the document is complete when the summary is shown
+atexit.register(_finish_lesson_at_exit)
+
+def _write(*fragments):
+    # markdown is written to sys.stdout: that's the current Document, or the capture of a running snippet.
+    _document.get_document()
+    if _concurrent_runs is not None:
+        _concurrent_runs.collect()
+    out = sys.stdout
+    for fragment in fragments:
+        out.write(fragment)
 
 def header_md(line, nesting=1):
     """ show argument string as markdown header. Nesting of level is set by nesting argument """
-    print( "\n" + ('#' * nesting) + " " + line  + "\n")
+    global _current_section
+    _current_section = line
+    _write("\n", '#' * nesting, " ", line, "\n\n")
 
 
 def print_md(*args):
@@ -16,7 +125,7 @@ def print_md(*args):
     paragraph = " ".join(map(str, args))
     paragraph =  paragraph.replace('_', "\\_") #.replace('#','\\#')
     paragraph = re.sub(r"^\s+","", paragraph)
-    print(paragraph)
+    _write(paragraph, "\n")
 
 def _quote_string(str):
    return str.replace("<","&lt;").replace(">","&gt;") 
@@ -24,112 +133,426 @@ def _quote_string(str):
 def print_quoted(*args):
     """show arguments as quoted text in markdown"""
     msg = '\n'.join(map(str, args)) 
-    print("```\n" +  msg + "\n```" )
+    _write("```\n", msg, "\n```\n")
 
 def print_quoted_pre(*args, quote_lt_gt):
     """show arguments as quoted text in markdown"""
     msg = '\n'.join(map(str, args)) 
     if quote_lt_gt:
         msg = _quote_string(msg)
-    print("<pre>\n" +  msg + "\n</pre>" )
+    _write("<pre>\n", msg, "\n</pre>\n")
 
 
 def print_code(*args,lang="python"):
     """show arguments as quoted text in markdown"""
-    print(f"```{lang}\n" +  '\n'.join(map(str, args)) + "\n```" )
+    _write(f"```{lang}\n", '\n'.join(map(str, args)), "\n```\n")
 
-def run_and_quote(file_name, command="python3", line_prefix="> ", exit_on_error=True, quote_lt_gt=False):
-    """show contents of file name, run the file name with command and show results"""
-    print("")
-    print("__Source:__")
-
-    with open(file_name,"r") as file:
-        src_code = file.read()
-        print_code(src_code)
+def run_and_quote(file_name, command="python3", line_prefix="> ", exit_on_error=True, quote_lt_gt=False, timeout=None, cpu_limit=None, memory_limit=None, invalidate_cache=False):
+    """show contents of file name, run the file name with command and show results
+       timeout, cpu_limit (seconds) and memory_limit (bytes of address space) limit the command, default limits are in MdfCfg
+       with MdfCfg.cache_dir set, the result is cached. invalidate_cache: run the file again, and replace the cached result
+       The source and the output are streamed in chunks, at most MdfCfg.max_render_bytes bytes of each are shown"""
+    _write("\n__Source:__\n", "```python\n")
+    with open(file_name, "rb") as file:
+        dropped = _capture.copy_chunks(file.read, sys.stdout, MdfCfg.max_render_bytes, translate_newlines=True)
+    if dropped:
+        _write("\n", _capture.cut_off_marker(dropped))
+    _write("\n```\n")
 
+    frame = inspect.currentframe()
     cmd_str = f"{command} {file_name}"
-    cmd = subb.RunCommand(stderr_as_stdout=True)
-    cmd.run(cmd_str)
+    limits = _default_limits().override(timeout, cpu_limit, memory_limit)
+    make_sink = lambda target, max_lines : _capture.OutputSink(line_prefix, max_lines, target, lambda : target.write("\n__Result:__\n"),
+                                                              "<pre>\n", "</pre>\n\n", _quote_string if quote_lt_gt else None)
+    with _measure("run_and_quote", frame.f_back) as record:
+        document = _document.current_document()
+        if MdfCfg.concurrent_runs and document is not None:
+            # the output is collected in the thread pool, and rendered when the placeholder is filled.
+            run = lambda : _run_file_cached(file_name, command, cmd_str, limits, invalidate_cache, lambda max_lines : make_sink(None, max_lines))
+            render = lambda result : _render_run_result(result, make_sink, cmd_str, exit_on_error)
+            _get_concurrent_runs().submit(document, record, run, render, _failures.lesson_location(frame.f_back))
+            return
+        # the output is rendered while the command is running
+        record.origin, out, exit_code, limit_error = _run_file_cached(file_name, command, cmd_str, limits, invalidate_cache, lambda max_lines : make_sink(_capture.resolve(sys.stdout), max_lines))
+        record.output_size = len(out)
 
-    out = cmd.output
+    fragments, must_exit = _run_error_fragments(exit_code, limit_error, cmd_str, exit_on_error)
+    _write(*fragments)
+    if must_exit:
+        _exit_on_run_error(fragments)
 
-    sline = out.strip()
-    if sline != "":
-        print("")
-        print("__Result:__")
-        print_quoted_pre( '\n'.join( map( lambda line : line_prefix + line, sline.split("\n") ) ), quote_lt_gt=quote_lt_gt)
-        print("")
+def _exit_on_run_error(fragments, location=None):
+    # in keep-going mode the failure is listed at the end of the lesson, and the lesson goes on
+    if MdfCfg.keep_going:
+        _failure_log.add("run_and_quote", "".join(fragments).strip(), location)
+        return
+    sys.exit(1)
 
-    if exit_on_error and cmd.exit_code != 0:
-        print(f"Error: Command {cmd_str} returned status {cmd.exit_code}")
-        sys.exit(1)
+def _render_run_result(result, make_sink, cmd_str, exit_on_error):
+    # returns the markdown that shows a result of _run_file_cached, and whether the lesson must stop because of an error
+    _, out, exit_code, limit_error = result
+    text = StringIO()
+    sink = make_sink(text, None)
+    sink.write(out)
+    sink.close_output()
+    fragments, must_exit = _run_error_fragments(exit_code, limit_error, cmd_str, exit_on_error)
+    return [ _capture.OutputText(text.getvalue()) ] + fragments, must_exit
 
+def _run_error_fragments(exit_code, limit_error, cmd_str, exit_on_error):
+    if limit_error is not None:
+        return [ f"Error: Command {cmd_str} {limit_error}\n" ], exit_on_error
+    if exit_on_error and exit_code != 0:
+        return [ f"Error: Command {cmd_str} returned status {exit_code}\n" ], True
+    return [], False
 
 
-def eval_and_quote(arg_str):
-    """evaluate the argument string, show the source and show the results"""
-    print("")
-    print("__Source:__")
+class _PendingRun:
+    """ a command started by run_and_quote in concurrent mode """
 
-    print_code(arg_str)
+    def __init__(self, document, record, future, render, location):
+        self.document = document
+        # file:line of the run_and_quote call, for keep-going mode
+        self.location = location
+        self.record = record
+        self.future = future
+        self.render = render
+        self.placeholder = None
 
-    @contextlib.contextmanager
-    def stderr_io(stderr=None):
-        old = sys.stderr
-        if stderr is None:
-            stderr = StringIO()
-        sys.stderr = stderr
-        yield stderr
-        sys.stderr = old
-
-    @contextlib.contextmanager
-    def stdout_io(stdout=None):
-        old = sys.stdout
-        if stdout is None:
-            stdout = StringIO()
-        sys.stdout = stdout
-        yield stdout
-        sys.stdout = old
-
-    def format_result(out, is_first):
-        sline = out.getvalue().strip()
-        if sline != "":
-            print("")
-            if is_first:
-                print("__Result:__")
-                is_first = False
-            print_quoted( '\n'.join( map( lambda line : ">> " + line, sline.split("\n") ) ) )
-            print("")
-        return is_first
-
-    # from walk_tb in https://github.com/python/cpython/blob/f6648e229edf07a1e4897244d7d34989dd9ea647/Lib/traceback.py#L93
-    # don't know if that might break in the future
-    def show_custom_trace(code, ex):
-        code_lines = arg_str.split("\n")
-
-        te = traceback.TracebackException.from_exception(ex)
-        first_frame = True
-        for frame_summary in te.stack:
-            if not first_frame:
-                lineno = frame_summary.lineno
-                error_line = ""
-                if len(code_lines) > lineno -1:
-                    error_line = code_lines[ lineno-1 ]
-                print(f"{frame_summary.name}")
-                print(f"\t{lineno}) {error_line}")
-            first_frame = False
 
-    frame = inspect.currentframe()
+class _ConcurrentRuns:
+    """ runs the commands of run_and_quote in a thread pool. The result of each command is filled into its placeholder in the document,
+        in source order. If a command fails with exit_on_error set, the document ends after its result and the lesson exits, as if the commands had run one after the other """
 
-    # get globals from calling frame...
-    calling_frame_globals = frame.f_back.f_globals
+    def __init__(self, max_workers):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        # commands whose result is not in the document yet, in document order
+        self.pending = []
+        # set if a command failed with exit_on_error set, after the lesson was done
+        self.failed = False
+        # the remaining commands are waited for at exit. Exit functions run in reverse order of registration: this one runs before the report of
+        # the performance recorder (it was started when the first command was measured), and before the document is closed.
+        atexit.register(self.finish)
+
+    def submit(self, document, record, run, render, location):
+        record.origin = "async"
+        # the cache is created here, not in a thread of the pool
+        _get_run_cache()
+        pending = _PendingRun(document, record, self.pool.submit(_timed, run), render, location)
+        pending.placeholder = document.add_placeholder(lambda : self.resolve(pending))
+        self.pending.append(pending)
+
+    def collect(self):
+        """ fill in the results of the commands that are done, without waiting """
+        while self.pending and self.pending[0].future.done():
+            self._complete(self.pending.pop(0))
+
+    def resolve(self, pending):
+        """ wait for the commands up to pending, fill in their results """
+        while pending in self.pending:
+            self._complete(self.pending.pop(0))
+
+    def _complete(self, pending):
+        duration, result = pending.future.result()
+        pending.record.origin = result[0]
+        pending.record.wall_time = duration
+        pending.record.output_size = len(result[1])
+        fragments, must_exit = pending.render(result)
+        if must_exit and MdfCfg.keep_going:
+            pending.document.fill(pending.placeholder, *fragments)
+            _exit_on_run_error(fragments[1:], pending.location)
+            return
+        if must_exit:
+            # the lesson stops here: the commands after this one are not shown
+            for later in self.pending:
+                later.future.cancel()
+            self.pending = []
+            pending.document.truncate_after(pending.placeholder)
+        pending.document.fill(pending.placeholder, *fragments)
+        if must_exit:
+            sys.exit(1)
+
+    def finish(self):
+        """ wait for the remaining commands, and fill in their results. Returns True if one of them failed with exit_on_error set """
+        try:
+            while self.pending:
+                self._complete(self.pending.pop(0))
+        except SystemExit:
+            # the lesson is done, it's too late to stop it: the failure sets the exit status (see _finish_lesson)
+            self.failed = True
+        finally:
+            self.pool.shutdown()
+        return self.failed
+
+def _timed(run):
+    start = time.perf_counter()
+    result = run()
+    return time.perf_counter() - start, result
+
+_concurrent_runs = None
+
+def _get_concurrent_runs():
+    global _concurrent_runs
+    if _concurrent_runs is None:
+        _concurrent_runs = _ConcurrentRuns(MdfCfg.max_concurrent_runs)
+    return _concurrent_runs
+
+
+def _get_run_cache():
+    if MdfCfg.cache_dir is None:
+        return None
+    return _snipcache.get_cache(MdfCfg.cache_dir, MdfCfg.cache_max_bytes, "run_and_quote")
+
+def _binary_id(command):
+    # path, size and modification time of the program started by command (for python: of the interpreter itself)
+    args = shlex.split(command)
+    path = _warmpool.interpreter_of(command) or (shutil.which(args[0]) if args else None)
+    if not path:
+        return command
+    path = os.path.realpath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def _run_cache_key(cache, file_name, command, limits):
+    file_hash = cache.hash_file(file_name)
+    env = sorted( filter( lambda item : any( map( lambda pattern : fnmatch.fnmatchcase(item[0], pattern), MdfCfg.run_cache_env ) ), os.environ.items() ) )
+    return cache.make_key(VERSION, file_hash, os.path.abspath(file_name), command, _binary_id(command), env, limits.timeout, limits.cpu_time, limits.memory,
+                          MdfCfg.max_output_lines, MdfCfg.max_render_bytes)
+
+def _run_file_cached(file_name, command, cmd_str, limits, invalidate, make_sink):
+    # with MdfCfg.cache_dir set: the result is taken from the cache, if the file, the command, the interpreter and the environment didn't change.
+    # The output is written to a sink returned by make_sink(max_lines), the cache keeps the output as shown (after eliding lines).
+    # returns (origin of the result: run or cache, output as shown, exit code, error message of an exceeded limit or None)
+    cache = _get_run_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = _run_cache_key(cache, file_name, command, limits)
+        if not (invalidate or MdfCfg.invalidate_run_cache):
+            cached = cache.get(cache_key)
+            if cached is not None:
+                sink = make_sink(None)
+                sink.write(cached[0])
+                return "cache", sink.close_output(), cached[1], None
+    sink = make_sink(MdfCfg.max_output_lines)
+    exit_code, limit_error = _run_file(file_name, command, cmd_str, limits, sink)
+    out = sink.close_output()
+    # a command that was stopped by a limit is run again next time
+    if cache is not None and limit_error is None:
+        cache.put(cache_key, [out, exit_code])
+    return "run", out, exit_code, limit_error
+
+def _run_file(file_name, command, cmd_str, limits, output):
+    # the output of the command is written to output, returns (exit code, error message of an exceeded limit or None)
+    if not limits.is_set() and MdfCfg.warm_pool and _warmpool.can_run(command):
+        exit_code = _warmpool.get_warm_pool(MdfCfg.warm_workers).run(file_name, output, MdfCfg.max_render_bytes)
+        if exit_code is not None:
+            return exit_code, None
+    return _limits.run_command(cmd_str, limits, output, MdfCfg.max_render_bytes)
+
+
+class _SnippetHistory:
+    """ the snippets evaluated so far by a lesson module """
+
+    def __init__(self):
+        # hash over the source of all preceding snippets
+        self.digest = ""
+        # dependency graph of the snippets, by global names read and written
+        self.graph = _snipdeps.SnippetGraph(_snipcache.ResultCache.make_key)
+        # indexes of snippets that were replayed from the cache, they still need to run before a snippet that depends on them is executed
+        self.not_run = []
+        # with MdfCfg.parallel set: the snippets of the lesson that run in a process pool
+        self.parallel = None
+        # indexes of the snippets that failed (keep-going mode)
+        self.failed = set()
+
+_snippet_histories = {}
+
+def _get_snippet_history(globals_dict):
+    history = _snippet_histories.get(id(globals_dict))
+    if history is None:
+        history = _SnippetHistory()
+        _snippet_histories[id(globals_dict)] = history
+        _precompile_snippets(globals_dict.get("__file__"))
+        if MdfCfg.parallel and MdfCfg.namespace == "shared" and _parallel.can_run(MdfCfg.parallel_backend):
+            history.parallel = _parallel.ParallelSnippets(globals_dict, MdfCfg.max_workers, _default_limits(), _make_should_submit(globals_dict), MdfCfg.parallel_backend)
+    return history
+
+def _precompile_snippets(lesson):
+    # all snippets of the lesson are compiled when the first one runs, so that syntax errors are reported before any slow snippet runs.
+    # The code objects are kept in the code cache, a snippet is not compiled again when it runs.
+    for line, message in _codecache.precompile(lesson, _get_code_cache(lesson), _SNIPPET_FUNCTIONS):
+        print(f"{os.path.basename(lesson)}:{line}: syntax error in snippet: {message}", file=sys.stderr)
+
+def _get_code_cache(lesson):
+    return _codecache.get_cache(MdfCfg.code_cache_dir or _codecache.default_dir(lesson))
+
+class _Namespace(dict):
+    """ globals of the snippets in a scope. A name that is not in the namespace is looked up when it is read: in the namespace of the
+        current scope, then in the globals of the lesson. An exported function sees the names of the snippet that calls it, as with shared globals """
+
+    def __init__(self, lesson_globals):
+        super().__init__()
+        self.lesson_globals = lesson_globals
+
+    def __missing__(self, name):
+        scope = _scopes.get(id(self.lesson_globals))
+        if scope is not None and scope.namespace is not self and name in scope.namespace:
+            return scope.namespace[name]
+        return self.lesson_globals[name]
+
+class _Scope:
+    """ the namespace of the snippets of a lesson in the current scope (section or snippet, see MdfCfg.namespace) """
+
+    def __init__(self, key, globals_dict):
+        self.key = key
+        self.namespace = _Namespace(globals_dict)
+        # the values that were taken from the globals of the lesson, by name
+        self.inherited = {}
+
+    def update(self, globals_dict):
+        # the globals of the lesson are taken as they are when a snippet runs; a name that a snippet of the scope has bound keeps its value.
+        # (the code of a class body looks up globals without calling __missing__)
+        for name, value in globals_dict.items():
+            if name not in self.namespace or (name in self.inherited and self.namespace[name] is self.inherited[name]):
+                self.namespace[name] = value
+                self.inherited[name] = value
+
+# the current scope of each lesson module, by id of the globals of the lesson
+_scopes = {}
+
+def _get_namespace(globals_dict):
+    # the globals for the next snippet. In mode "section" the snippets of a section share a namespace, in mode "snippet" each one gets its own;
+    # the names that the snippets of the scope didn't bind are taken from the globals of the lesson before each snippet.
+    # The objects of the previous scope are collected, before the new one starts.
+    mode = MdfCfg.namespace
+    if mode == "shared":
+        return globals_dict
+    key = _current_section if mode == "section" else None
+    scope = _scopes.get(id(globals_dict))
+    if scope is None or mode == "snippet" or scope.key != key:
+        if scope is not None:
+            del _scopes[id(globals_dict)]
+            del scope
+            gc.collect()
+        scope = _Scope(key, globals_dict)
+        _scopes[id(globals_dict)] = scope
+    scope.update(globals_dict)
+    return scope.namespace
+
+def _export(namespace, globals_dict, exports):
+    # copy the names listed in exports from the namespace of a snippet to the globals of the lesson
+    if namespace is globals_dict or not exports:
+        return
+    for name in exports:
+        if name in namespace:
+            globals_dict[name] = namespace[name]
+
+def _get_cache():
+    # results are cached for snippets that share the globals of the lesson only
+    if MdfCfg.cache_dir is None or MdfCfg.namespace != "shared":
+        return None
+    return _snipcache.get_cache(MdfCfg.cache_dir, MdfCfg.cache_max_bytes, "eval_and_quote")
+
+def _cache_key(cache, digest, node):
+    # digest: hash over all snippets before node
+    if MdfCfg.incremental:
+        return cache.make_key(sys.version, VERSION, "incremental", node.key)
+    return cache.make_key(sys.version, VERSION, digest, node.source)
+
+def _is_replayable(out, err):
+    # output that shows object addresses (or ids) can't be replayed: the objects of the live run have other addresses.
+    return not _normalize.contains_address(out) and not _normalize.contains_address(err)
+
+def _make_should_submit(globals_dict):
+    # snippets that are run in-process anyway, or that are in the cache, are not given to the process pool.
+    def should_submit(node, digest):
+        if not _can_skip_snippet(node, globals_dict):
+            return False
+        cache = _get_cache()
+        return cache is None or not cache.contains(_cache_key(cache, digest, node))
+    return should_submit
+
+
+def _stderr_io(stderr=None):
+    # output to sys.stderr in this thread (and the tasks it creates) goes to stderr
+    if stderr is None:
+        stderr = StringIO()
+    return _capture.redirect("stderr", stderr)
+
+def _stdout_io(stdout=None):
+    # output to sys.stdout in this thread (and the tasks it creates) goes to stdout
+    if stdout is None:
+        stdout = StringIO()
+    return _capture.redirect("stdout", stdout)
+
+def _format_result(out, is_first):
+    sline = out.strip()
+    if sline != "":
+        _write("\n")
+        if is_first:
+            _write("__Result:__\n")
+            is_first = False
+        _write("```\n", _capture.OutputText( '\n'.join( map( lambda line : ">> " + line, sline.split("\n") ) ) ), "\n```\n")
+        _write("\n")
+    return is_first
+
+def _show_eval_result(out, err):
+    is_first = True
+    is_first = _format_result(out, is_first)
+    _format_result(err, is_first)
+
+# from walk_tb in https://github.com/python/cpython/blob/f6648e229edf07a1e4897244d7d34989dd9ea647/Lib/traceback.py#L93
+# don't know if that might break in the future
+def _show_custom_trace(arg_str, ex):
+    code_lines = arg_str.split("\n")
+
+    te = traceback.TracebackException.from_exception(ex)
+    first_frame = True
+    for frame_summary in te.stack:
+        # the frame of the timer that stopped the snippet, and the frames of the event loop are not shown.
+        if frame_summary.filename == _limits.__file__ or _eventloop.is_loop_frame(frame_summary.filename):
+            continue
+        if not first_frame:
+            lineno = frame_summary.lineno
+            error_line = ""
+            if len(code_lines) > lineno -1:
+                error_line = code_lines[ lineno-1 ]
+            print(f"{frame_summary.name}")
+            print(f"\t{lineno}) {error_line}")
+        first_frame = False
+
+def _default_limits():
+    return _limits.Limits(MdfCfg.timeout, MdfCfg.cpu_limit, MdfCfg.memory_limit)
+
+def _eval_snippet(arg_str, globals_dict, limits=None, show=False):
+    """ run the snippet in the given globals, returns the text written to standard output and standard error, and the error status.
+        With show set the result is shown, standard output is shown while the snippet is running. Output is limited to MdfCfg.max_output_lines.
+        A snippet with top level await runs on the event loop of the lesson """
+    return _eventloop.drive(_eval_snippet_steps(arg_str, globals_dict, limits, show), globals_dict)
+
+def _eval_snippet_steps(arg_str, globals_dict, limits=None, show=False, instrument=None):
+    # generator that evaluates the snippet, the coroutine of a snippet with top level await is yielded: it is run by the caller (see eventloop.drive)
+    # instrument is called with the compiled snippet, it returns a context manager that is entered while the snippet is running
+    # (a cProfile.Profile, an allocations.AllocationTracker, a linecounts.LineCounter)
+    if limits is None:
+        limits = _default_limits()
     has_error = False
-    with stderr_io() as serr:
-        with stdout_io() as sout:
+    target = _capture.resolve(sys.stdout) if show else None
+    sout_sink = _capture.OutputSink(">> ", MdfCfg.max_output_lines, target, lambda : target.write("\n__Result:__\n"))
+    serr_sink = _capture.OutputSink(">> ", MdfCfg.max_output_lines)
+    with _stderr_io(serr_sink) as serr:
+        with _stdout_io(sout_sink) as sout:
             exc = None
 
             try:
-                exec(arg_str, calling_frame_globals)
+                with _limits.in_process_limits(limits):
+                    code = _get_code_cache(globals_dict.get("__file__")).compile(arg_str)
+                    with instrument(code) if instrument is not None else contextlib.nullcontext():
+                        result = eval(code, globals_dict)
+                        if _eventloop.is_async(code):
+                            yield result
             except SyntaxError as err:
                 # get error line
                 error_line = ""
@@ -138,7 +561,12 @@ def eval_and_quote(arg_str):
                     error_line = code_lines[ err.lineno-1 ]
                 print("syntax error: ", err, "\n" + str(err.lineno-1) + ")", error_line)
                 has_error = True
-            except Exception as err:
+            except MemoryError as err:
+                limit_msg = "" if limits.memory is None else f" memory limit of {limits.memory} bytes exceeded"
+                print(f"Error in code. exception: MemoryError{limit_msg}", err)
+                exc = err
+                has_error = True
+            except (Exception, _limits.SnippetLimitExceeded) as err:
                 print("Error in code. exception:", err)
                 exc = err
                 has_error = True
@@ -146,12 +574,310 @@ def eval_and_quote(arg_str):
             if exc is not None:
                 # this doesn't show the line that caused the exception
                 #traceback.print_exc()
-                show_custom_trace(arg_str, exc)
+                _show_custom_trace(arg_str, exc)
 
+    out = sout.close_output()
+    err = serr.close_output()
+    if show:
+        _format_result(err, not sout.has_content())
+    return out, err, has_error
 
-    is_first = True
-    is_first = format_result(sout, is_first)
-    format_result(serr, is_first)
+def _exit_on_eval_error(out=""):
+    # in keep-going mode the failure is listed at the end of the lesson, and the lesson goes on. out: the captured output of the snippet
+    if MdfCfg.keep_going:
+        message = next( filter( lambda line : line.startswith(("Error in code", "syntax error")), out.split("\n") ), "the snippet failed" )
+        _failure_log.add("snippet", message.strip())
+        return
+    print("Error during evalutation of the preceeding code snippet, see standard output for more details.", file=sys.stderr)
+    sys.exit(1)
+
+def _run_not_run_snippets_steps(history, globals_dict, node):
+    # snippets replayed from the cache did not define anything, run them now (output is not shown a second time)
+    # In incremental mode: only the snippets that the current snippet depends on are run. Without node: all of them are run.
+    if MdfCfg.incremental and node is not None:
+        upstream = history.graph.upstream(node.index)
+        to_run = list( filter( lambda index : index in upstream, history.not_run ) )
+        history.not_run = list( filter( lambda index : index not in upstream, history.not_run ) )
+    else:
+        to_run = history.not_run
+        history.not_run = []
+    for index in to_run:
+        out, err, has_error = yield from _eval_snippet_steps(history.graph.nodes[index].source, globals_dict)
+        # a snippet that failed when it was shown (keep-going mode) fails again, silently
+        if has_error and index not in history.failed:
+            _show_eval_result(out, err)
+            _exit_on_eval_error(out)
+
+def _can_skip_snippet(node, globals_dict):
+    # a snippet that is replayed from the cache is not run, until the next snippet that depends on it is not in the cache.
+    # That's only possible, if the code of the lesson file does not refer to any of the names used in the snippet.
+    names = node.names
+    if names is None or names.is_dynamic:
+        return False
+    lesson_names = _snipdeps.lesson_names(globals_dict.get("__file__"))
+    if lesson_names is None:
+        return False
+    return not node.touched & lesson_names
+
+def _measure(kind, calling_frame):
+    # with MdfCfg.perf_report set: record time and memory used by the snippet evaluated by the calling frame.
+    # With MdfCfg.retained_report set, or snippets that don't share the globals of the lesson, the retained memory is reported.
+    if not (MdfCfg.perf_report or _retained_report()):
+        return contextlib.nullcontext(_perfstats.SnippetRecord(kind, None, None, None))
+    recorder = _perfstats.get_recorder(MdfCfg.perf_top, MdfCfg.perf_report)
+    return recorder.measure(kind, calling_frame.f_globals.get("__file__", "<unknown>"), calling_frame.f_lineno, _current_section)
+
+def _retained_report():
+    return MdfCfg.retained_report or MdfCfg.namespace != "shared"
+
+def _make_line_counter():
+    # with MdfCfg.line_counts or MdfCfg.line_heat set: the lines of each snippet of eval_and_quote are counted
+    if not (MdfCfg.line_counts or MdfCfg.line_heat):
+        return None
+    return _linecounts.LineCounter()
+
+def _code_block(arg_str, lang="python"):
+    return f"```{lang}\n{arg_str}\n```\n"
+
+def _quote_source(arg_str, counter):
+    # shows the source of a snippet. With MdfCfg.line_heat set, a placeholder stands in for the source: once the snippet has run, it is filled
+    # with the source annotated by the line counts. Returns the function that fills the placeholder.
+    document = _document.current_document()
+    if counter is None or not MdfCfg.line_heat or document is None:
+        print_code(arg_str)
+        return lambda : None
+    plain = _code_block(arg_str)
+    placeholder = document.add_placeholder(lambda : document.fill(placeholder, plain))
+    return lambda : document.fill(placeholder, counter.annotate(arg_str) if counter.code is not None else plain)
+
+def _add_line_counts(calling_frame_globals, line, arg_str, counter):
+    # the line counts of a snippet that ran go to LESSON.coverage.json
+    if counter is not None and counter.code is not None:
+        _linecounts.get_report(calling_frame_globals.get("__file__", "lesson")).add(line, arg_str, counter)
+
+# functions called after each snippet evaluated by eval_and_quote (the checkpoint build daemon uses this)
+_after_snippet_hooks = []
+
+def eval_and_quote(arg_str, timeout=None, cpu_limit=None, memory_limit=None, exports=None):
+    """evaluate the argument string, show the source and show the results
+       timeout, cpu_limit (seconds) and memory_limit (bytes that the snippet may allocate) limit the snippet, default limits are in MdfCfg
+       exports: names defined by the snippet that are copied to the globals of the lesson, if the snippet runs in its own namespace (see MdfCfg.namespace)"""
+    _write("\n__Source:__\n")
+
+    counter = _make_line_counter()
+    show_counts = _quote_source(arg_str, counter)
+
+    frame = inspect.currentframe()
+
+    # get globals from calling frame...
+    calling_frame_globals = frame.f_back.f_globals
+
+    with _measure("eval_and_quote", frame.f_back) as record:
+        limits = _default_limits().override(timeout, cpu_limit, memory_limit)
+        steps = _eval_and_show_steps(arg_str, calling_frame_globals, limits, counter, exports)
+        record.origin, record.output_size = _eventloop.drive(steps, calling_frame_globals)
+
+    show_counts()
+    _add_line_counts(calling_frame_globals, frame.f_back.f_lineno, arg_str, counter)
+
+    for hook in _after_snippet_hooks:
+        hook()
+
+async def eval_and_quote_async(arg_str, timeout=None, cpu_limit=None, memory_limit=None, exports=None):
+    """as eval_and_quote, for lesson code that runs in an event loop: await eval_and_quote_async(...)
+       A snippet with top level await is awaited in the running event loop. Note that other tasks of that loop write to the result of the snippet, while it is waiting"""
+    _write("\n__Source:__\n")
+
+    counter = _make_line_counter()
+    show_counts = _quote_source(arg_str, counter)
+
+    frame = inspect.currentframe()
+
+    calling_frame_globals = frame.f_back.f_globals
+
+    with _measure("eval_and_quote", frame.f_back) as record:
+        limits = _default_limits().override(timeout, cpu_limit, memory_limit)
+        steps = _eval_and_show_steps(arg_str, calling_frame_globals, limits, counter, exports)
+        record.origin, record.output_size = await _eventloop.drive_async(steps)
+
+    show_counts()
+    _add_line_counts(calling_frame_globals, frame.f_back.f_lineno, arg_str, counter)
+
+    for hook in _after_snippet_hooks:
+        hook()
+
+def _eval_and_show_steps(arg_str, calling_frame_globals, limits, counter=None, exports=None):
+    # with MdfCfg.cache_dir set: the output of the snippet is taken from the cache, if the snippet and all snippets before it did not change.
+    # with MdfCfg.incremental set: only the snippets that this one depends on must be unchanged.
+    # with MdfCfg.parallel set: the output of the snippet may come from the process pool.
+    # In all these cases the snippet is not run in-process, unless the lesson code refers to the names it uses, or its lines are counted (counter).
+    # The snippet runs in the namespace given by MdfCfg.namespace, exports are copied from there to the globals of the lesson.
+    history = _get_snippet_history(calling_frame_globals)
+    namespace = _get_namespace(calling_frame_globals)
+    node = history.graph.add(arg_str)
+    cache = _get_cache()
+    if cache is not None:
+        cache_key = _cache_key(cache, history.digest, node)
+    history.digest = _snipcache.ResultCache.make_key(history.digest, arg_str)
+
+    if cache is not None or history.parallel is not None:
+        if counter is None and _can_skip_snippet(node, calling_frame_globals):
+            result = None
+            if cache is not None:
+                cached = cache.get(cache_key)
+                if cached is not None and _is_replayable(cached[0], cached[1]):
+                    result = (cached[0], cached[1], False)
+                    origin = "cache"
+            if result is None and history.parallel is not None:
+                result = history.parallel.result(node.index, arg_str)
+                origin = "pool"
+                if result is not None and not _is_replayable(result[0], result[1]):
+                    result = None
+                if result is not None and not result[2] and cache is not None:
+                    cache.put(cache_key, [result[0], result[1]])
+            if result is not None:
+                out, err, has_error = result
+                _show_eval_result(out, err)
+                if has_error:
+                    history.failed.add(node.index)
+                    _exit_on_eval_error(out)
+                history.not_run.append(node.index)
+                return origin, len(out) + len(err)
+        yield from _run_not_run_snippets_steps(history, namespace, node)
+
+    out, err, has_error = yield from _eval_snippet_steps(arg_str, namespace, limits, show=True, instrument=counter)
     if has_error:
-        print("Error during evalutation of the preceeding code snippet, see standard output for more details.", file=sys.stderr)
-        sys.exit(1)
+        history.failed.add(node.index)
+        _exit_on_eval_error(out)
+    elif cache is not None and _is_replayable(out, err):
+        cache.put(cache_key, [out, err])
+    _export(namespace, calling_frame_globals, exports)
+    return "run", len(out) + len(err)
+
+def profile_and_quote(arg_str, top=None, sort=None, pstats_file=None, timeout=None, cpu_limit=None, memory_limit=None):
+    """evaluate the argument string under cProfile, show the source, the results and a table of the top functions (calls, tottime, cumtime)
+       top is the number of functions shown, sort the pstats sort key; defaults are in MdfCfg (profile_top, profile_sort)
+       pstats_file: the profile is also written to this file. With MdfCfg.profile_dump set, it is written to LESSON.LINE.pstats by default
+       The snippet always runs, its result is not cached: the numbers are measured again on each build"""
+    _write("\n__Source:__\n")
+
+    print_code(arg_str)
+
+    frame = inspect.currentframe()
+
+    calling_frame_globals = frame.f_back.f_globals
+
+    if top is None:
+        top = MdfCfg.profile_top
+    if sort is None:
+        sort = MdfCfg.profile_sort
+    if pstats_file is None and MdfCfg.profile_dump:
+        pstats_file = _profiling.pstats_path(calling_frame_globals.get("__file__", "lesson"), frame.f_back.f_lineno)
+
+    with _measure("profile_and_quote", frame.f_back) as record:
+        limits = _default_limits().override(timeout, cpu_limit, memory_limit)
+        profiler = _profiling.make_profiler()
+        steps = _instrumented_steps(arg_str, calling_frame_globals, limits, lambda _code : profiler)
+        record.output_size = _eventloop.drive(steps, calling_frame_globals)
+
+    _write("\n__Profile:__\n\n", _profiling.format_table(_profiling.hottest_functions(profiler, top, sort)), "\n")
+    if pstats_file is not None:
+        profiler.dump_stats(pstats_file)
+
+    for hook in _after_snippet_hooks:
+        hook()
+
+def _instrumented_steps(arg_str, calling_frame_globals, limits, instrument):
+    # the snippet is part of the history of the lesson (the following snippets may depend on it), but it is always run in-process.
+    history = _get_snippet_history(calling_frame_globals)
+    namespace = _get_namespace(calling_frame_globals)
+    node = history.graph.add(arg_str)
+    history.digest = _snipcache.ResultCache.make_key(history.digest, arg_str)
+    yield from _run_not_run_snippets_steps(history, namespace, node)
+
+    out, err, has_error = yield from _eval_snippet_steps(arg_str, namespace, limits, show=True, instrument=instrument)
+    if has_error:
+        history.failed.add(node.index)
+        _exit_on_eval_error(out)
+    return len(out) + len(err)
+
+def timeit_and_quote(*variants, labels=None, setup="pass", repeat=None, number=None, timeout=None, cpu_limit=None, memory_limit=None):
+    """time each of the variants (statements, evaluated with the globals of the calling module) and show a table that compares them:
+       min, median, standard deviation and the 95% confidence interval of the mean time per loop.
+       The loop count is auto-ranged as by timeit, unless number is given; repeat is the number of samples (default is MdfCfg.timeit_repeat)
+       labels: names of the variants in the table, setup: statement that runs before each sample. Output of the variants is not shown
+       With MdfCfg.timeit_store set, the results are stored in LESSON.timing.json, and changes against the previous build are shown"""
+    if labels is None:
+        labels = list( map( lambda index : f"variant {index + 1}", range(len(variants)) ) )
+    _write("\n__Source:__\n")
+    if setup != "pass":
+        _write("\nsetup:\n")
+        print_code(setup)
+    for label, stmt in zip(labels, variants):
+        _write("\n", label, ":\n")
+        print_code(stmt)
+
+    frame = inspect.currentframe()
+    calling_frame_globals = frame.f_back.f_globals
+
+    if repeat is None:
+        repeat = MdfCfg.timeit_repeat
+    store = _timing.get_store(calling_frame_globals.get("__file__", "lesson")) if MdfCfg.timeit_store else None
+
+    with _measure("timeit_and_quote", frame.f_back):
+        # the variants may use anything defined by the snippets before, those that were replayed from the cache must run now.
+        history = _get_snippet_history(calling_frame_globals)
+        namespace = _get_namespace(calling_frame_globals)
+        _eventloop.drive(_run_not_run_snippets_steps(history, namespace, None), calling_frame_globals)
+
+        limits = _default_limits().override(timeout, cpu_limit, memory_limit)
+        results = []
+        for label, stmt in zip(labels, variants):
+            try:
+                with _stdout_io(), _stderr_io(), _limits.in_process_limits(limits):
+                    loops, samples = _timing.measure(stmt, setup, namespace, repeat, number)
+            except (Exception, _limits.SnippetLimitExceeded) as err:
+                _write("\n__Result:__\n")
+                print_quoted(f">> Error in code. exception: {err}")
+                _exit_on_eval_error(f"Error in code. exception: {err}")
+                continue
+            result = _timing.TimingResult(label, _snipcache.ResultCache.make_key(setup, stmt), loops, samples)
+            if store is not None:
+                store.add(result)
+                change = result.change()
+                if change is not None and change > MdfCfg.timeit_threshold:
+                    print(f"timing regression: {label} median {_timing.format_time(result.median)} was {_timing.format_time(result.previous)} ({change:+.1%})", file=sys.stderr)
+            results.append(result)
+
+    _write("\n__Timing:__\n\n", _timing.format_table(results, MdfCfg.timeit_threshold), "\n")
+
+    for hook in _after_snippet_hooks:
+        hook()
+
+def tracemalloc_and_quote(arg_str, top=None, timeout=None, cpu_limit=None, memory_limit=None):
+    """evaluate the argument string under tracemalloc, show the source, the results, the peak and the net retained memory of the snippet,
+       and a table of the top lines of the snippet by retained memory (top defaults to MdfCfg.tracemalloc_top)
+       The snippet always runs, its result is not cached: the numbers are measured again on each build"""
+    _write("\n__Source:__\n")
+
+    print_code(arg_str)
+
+    frame = inspect.currentframe()
+
+    calling_frame_globals = frame.f_back.f_globals
+
+    if top is None:
+        top = MdfCfg.tracemalloc_top
+
+    with _measure("tracemalloc_and_quote", frame.f_back) as record:
+        limits = _default_limits().override(timeout, cpu_limit, memory_limit)
+        tracker = _allocations.AllocationTracker(MdfCfg.tracemalloc_frames)
+        steps = _instrumented_steps(arg_str, calling_frame_globals, limits, lambda _code : tracker)
+        record.output_size = _eventloop.drive(steps, calling_frame_globals)
+
+    _write("\n__Memory:__\n\n",
+           f"peak: {_perfstats.format_size(tracker.peak)}, retained: {_perfstats.format_size(tracker.retained)}\n\n",
+           _allocations.format_table(tracker.sites(top), arg_str, _perfstats.format_size), "\n")
+
+    for hook in _after_snippet_hooks:
+        hook()
@@ -0,0 +1,108 @@
+import re
+import random
+from .cfg import MdfCfg
+
+# dates like 2021-10-17 or Sunday 17/10/2021, times like 04:39:50.123 +0300
+_TIMESTAMP_RE = re.compile(r"\b(?:(?:Mon|Tues|Wednes|Thurs|Fri|Satur|Sun)day,? )?\d{1,4}[-/]\d{1,2}[-/]\d{1,4}\b|\b\d{1,2}:\d{2}:\d{2}(?:\.\d+)?(?: [+-]\d{4}\b)?")
+_WEEKDAY_RE = re.compile(r"[A-Z][a-z]+day")
+_DIGIT_RE = re.compile(r"\d")
+
+# port of a socket address: ('127.0.0.1', 54321), 127.0.0.1:54321, localhost:54321, [::1]:54321
+_PORT_RE = re.compile(r"(?P<host>'[^'\n]*', |\b(?:\d{1,3}\.){3}\d{1,3}:|\blocalhost:|\]:)(?P<port>\d{5})\b")
+
+# ports from here on are ephemeral ones, given by the system (the linux default range starts at 32768, the IANA one at 49152)
+_FIRST_EPHEMERAL_PORT = 32768
+
+# object addresses are aligned to at least eight bytes, other numbers that look like addresses are left alone
+_ADDRESS_ALIGNMENT = 8
+
+def _mask_timestamp(match):
+    return _DIGIT_RE.sub("X", _WEEKDAY_RE.sub("Weekday", match.group(0)))
+
+def _address_value(text):
+    return int(text, 16) if text.startswith("0x") else int(text)
+
+def _is_address(text):
+    return _address_value(text) % _ADDRESS_ALIGNMENT == 0
+
+def _address_re(patterns):
+    return re.compile( "|".join( map( lambda pattern : f"(?:{pattern})", patterns ) ) )
+
+_default_address_re = None
+
+def contains_address(text, patterns=None):
+    """ true if the text contains an object address (see Normalizer), such output differs between runs of the lesson """
+    global _default_address_re
+    if patterns is None:
+        if _default_address_re is None:
+            _default_address_re = _address_re(MdfCfg.normalize_patterns)
+        address_re = _default_address_re
+    else:
+        address_re = _address_re(patterns)
+    return any( map( lambda match : _is_address(match.group(0)), address_re.finditer(text) ) )
+
+
+class Normalizer:
+    """ makes captured output reproducible: object addresses (matches of any of the patterns, that are aligned like an address) are replaced
+        by ordinals, in the order in which they first appear in the document. The same address always gets the same ordinal:
+        hexadecimal addresses are replaced by 0x000000000001, ..., decimal ones by 000000000001, ...
+        Ephemeral port numbers of socket addresses are replaced by 50001, 50002, ... in the same way.
+        With mask_timestamps set, the digits of dates and times are replaced by X.
+        The normalizer is applied to captured output only, not to the source code and the text of the lesson """
+
+    def __init__(self, patterns, mask_timestamps=False):
+        self.address_re = _address_re(patterns)
+        self.mask_timestamps = mask_timestamps
+        self.ordinals = {}
+        self.count = 0
+        self.ports = {}
+        self.port_count = 0
+
+    def __call__(self, text):
+        text = self.address_re.sub(self._ordinal, text)
+        text = _PORT_RE.sub(self._port, text)
+        if self.mask_timestamps:
+            text = _TIMESTAMP_RE.sub(_mask_timestamp, text)
+        return text
+
+    def _ordinal(self, match):
+        address = match.group(0)
+        replacement = self.ordinals.get(address)
+        if replacement is None:
+            if not _is_address(address):
+                return address
+            self.count += 1
+            replacement = f"0x{self.count:012x}" if address.startswith("0x") else f"{self.count:012d}"
+            self.ordinals[address] = replacement
+            # normalizing the same text twice gives the same result
+            self.ordinals[replacement] = replacement
+        return replacement
+
+    def _port(self, match):
+        port = match.group("port")
+        if int(port) < _FIRST_EPHEMERAL_PORT:
+            return match.group(0)
+        replacement = self.ports.get(port)
+        if replacement is None:
+            self.port_count += 1
+            replacement = str(50000 + self.port_count)
+            self.ports[port] = replacement
+            self.ports[replacement] = replacement
+        return match.group("host") + replacement
+
+
+def make_normalizer():
+    """ returns the Normalizer for a new document, or None if MdfCfg.normalize is off """
+    if not MdfCfg.normalize:
+        return None
+    return Normalizer(MdfCfg.normalize_patterns, MdfCfg.mask_timestamps)
+
+def seed_random():
+    """ with MdfCfg.normalize set: seed the random module with MdfCfg.random_seed """
+    if MdfCfg.normalize:
+        random.seed(MdfCfg.random_seed)
+
+def needs_hash_seed(environ):
+    """ with MdfCfg.normalize set: true if the environment doesn't set PYTHONHASHSEED to MdfCfg.random_seed.
+        String hashing (the order of sets) is fixed when the interpreter starts, the build driver sets the variable before it runs a lesson """
+    return MdfCfg.normalize and environ.get("PYTHONHASHSEED") != str(MdfCfg.random_seed)
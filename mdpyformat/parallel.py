@@ -0,0 +1,110 @@
+import os
+import sys
+import builtins
+import atexit
+import multiprocessing
+import concurrent.futures
+from . import mdf as _mdf
+from . import snipdeps as _snipdeps
+from . import snipcache as _snipcache
+from . import eventloop as _eventloop
+from . import subinterp as _subinterp
+from .cfg import MdfCfg
+
+def _run_in_worker(upstream_sources, arg_str, limits):
+    # runs in a worker process (or thread): run all snippets that this one depends on (output is discarded), then run the snippet itself,
+    # in a new namespace. The snippets are self-contained, they don't need the globals of the lesson.
+    globals_dict = { "__name__" : "__main__", "__builtins__" : builtins }
+    try:
+        for source in upstream_sources:
+            _, _, has_error = _mdf._eval_snippet(source, globals_dict, limits)
+            if has_error:
+                break
+        return _mdf._eval_snippet(arg_str, globals_dict, limits)
+    finally:
+        _eventloop.close_event_loop(globals_dict)
+
+
+class ParallelSnippets:
+    """ runs the snippets of a lesson in a process pool (backend "process"), a thread pool (backend "thread"),
+        or in sub-interpreters (backend "interpreter", a snippet that fails there is evaluated in-process), as soon as the lesson starts.
+        Independent snippets run at the same time, as each worker first runs the chain of snippets that its snippet depends on.
+        The results are picked up in source order by eval_and_quote.
+        Only snippets that are self-contained (see snipdeps.SnippetGraph.is_self_contained) are given to the workers: the snippets of their chain
+        have no effect outside of the namespace they run in, so running the chain again in a worker is not visible; all other snippets run in-process.
+        Neither the workers nor the sub-interpreters see the globals of the lesson.
+        Limits only work in a process, with limits set the thread pool and the sub-interpreters are not used; nor are the sub-interpreters used with tracemalloc """
+
+    def __init__(self, globals_dict, max_workers, limits, should_submit, backend="process"):
+        self.futures = []
+        # snippets of profile_and_quote and tracemalloc_and_quote are part of the dependency graph, but always run in-process.
+        self.snippets = _snipdeps.lesson_snippets(globals_dict.get("__file__"), _mdf._SNIPPET_FUNCTIONS)
+        if not self.snippets:
+            return
+
+        self.interpreters = None
+        if backend in ("thread", "interpreter"):
+            # tracemalloc (perf_report, retained_report, tracemalloc_and_quote) is not safe to use while sub-interpreters are running
+            uses_tracemalloc = MdfCfg.perf_report or MdfCfg.retained_report or any( map( lambda snippet : snippet is not None and snippet.func_name == "tracemalloc_and_quote", self.snippets ) )
+            if limits.is_set() or (backend == "interpreter" and uses_tracemalloc):
+                self.snippets = None
+                return
+            if backend == "interpreter":
+                self.interpreters = _subinterp.InterpreterPool(max_workers)
+            else:
+                # output of snippets running in threads is kept apart by capture.redirect
+                self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mdf-snippet")
+        else:
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork"))
+        atexit.register(self.shutdown)
+
+        graph = _snipdeps.SnippetGraph(_snipcache.ResultCache.make_key)
+        digest = ""
+        for snippet in self.snippets:
+            if snippet is None:
+                break
+            arg_str = snippet.source
+            node = graph.add(arg_str)
+            future = None
+            # snippets with keyword arguments (like per-call limits) run in-process, exports don't change the result of the snippet.
+            if not set(snippet.keywords) - { "exports" } and snippet.func_name == "eval_and_quote" and graph.is_self_contained(node.index) and should_submit(node, digest):
+                upstream = list( map( lambda index : graph.nodes[index].source, sorted(graph.upstream(node.index)) ) )
+                if self.interpreters is not None:
+                    future = self.interpreters.submit(upstream + [ arg_str ], MdfCfg.max_output_lines)
+                else:
+                    future = self.pool.submit(_run_in_worker, upstream, arg_str, limits)
+            self.futures.append(future)
+            digest = _snipcache.ResultCache.make_key(digest, arg_str)
+
+    def result(self, index, arg_str):
+        """ returns (stdout, stderr, has_error) of the snippet at index, or None if it did not run in the pool """
+        if index >= len(self.futures) or self.snippets[index].source != arg_str:
+            # the lesson did not evaluate the snippets that were found in the source, results are no longer valid.
+            self.shutdown()
+            return None
+        future = self.futures[index]
+        if future is None:
+            return None
+        result = future.result()
+        if result is not None and self.interpreters is not None:
+            # None: the snippet failed in the sub-interpreter, it is evaluated in-process
+            result = (result[0], result[1], False)
+        return result
+
+    def shutdown(self):
+        if self.futures:
+            self.futures = []
+            if self.interpreters is not None:
+                self.interpreters.close()
+            else:
+                self.pool.shutdown(cancel_futures=True)
+
+
+def can_run(backend):
+    """ true if the backend can be used on this system. Without sub-interpreters (before python 3.12) snippets are evaluated in-process """
+    if backend == "interpreter":
+        return _subinterp.available()
+    return backend == "thread" or can_fork()
+
+def can_fork():
+    return "fork" in multiprocessing.get_all_start_methods() and hasattr(os, "fork") and sys.platform != "win32"
@@ -0,0 +1,117 @@
+import os
+import sys
+import gc
+import json
+import time
+import atexit
+import tracemalloc
+import contextlib
+
+
+class SnippetRecord:
+    """ time and memory used by a snippet evaluated with eval_and_quote, or a file run with run_and_quote """
+
+    def __init__(self, kind, lesson, line, section):
+        self.kind = kind
+        self.lesson = lesson
+        self.line = line
+        self.section = section
+        # where the result came from: run, cache, pool
+        self.origin = "run"
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.peak_memory = 0
+        # memory allocated by the snippet that is still in use after it (and a garbage collection): objects kept in the namespace, caches
+        self.retained_memory = 0
+        self.output_size = 0
+
+    def location(self):
+        return f"{os.path.basename(self.lesson)}:{self.line}"
+
+
+class PerfRecorder:
+    """ collects a SnippetRecord per snippet. At exit the records are written to a json file next to each lesson,
+        and a table of the slowest snippets is shown on standard error, followed by the snippets that retained the most memory.
+        With timing off, only the retained memory is shown """
+
+    def __init__(self, top_n, timing=True):
+        self.top_n = top_n
+        self.timing = timing
+        self.records = []
+        atexit.register(self.report)
+
+    @contextlib.contextmanager
+    def measure(self, kind, lesson, line, section):
+        record = SnippetRecord(kind, lesson, line, section)
+        was_tracing = tracemalloc.is_tracing()
+        if was_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_time = time.perf_counter() - start_wall
+            record.cpu_time = time.process_time() - start_cpu
+            record.peak_memory = tracemalloc.get_traced_memory()[1]
+            gc.collect()
+            record.retained_memory = max(0, tracemalloc.get_traced_memory()[0] - start_memory)
+            if not was_tracing:
+                tracemalloc.stop()
+            self.records.append(record)
+
+    def report(self):
+        if not self.timing:
+            self.show_retained(sys.stderr)
+            return
+        by_lesson = {}
+        for record in self.records:
+            by_lesson.setdefault(record.lesson, []).append(record)
+        for lesson, records in by_lesson.items():
+            sidecar = os.path.splitext(lesson)[0] + ".perf.json"
+            try:
+                with open(sidecar, "w", encoding="utf-8") as file:
+                    json.dump( list( map( lambda record : record.__dict__, records ) ), file, indent=2 )
+            except OSError as err:
+                print(f"can't write {sidecar}: {err}", file=sys.stderr)
+        self.show_slowest(sys.stderr)
+        self.show_retained(sys.stderr)
+
+    def show_slowest(self, file):
+        slowest = sorted( self.records, key=lambda record : record.wall_time, reverse=True )[ : self.top_n ]
+        if not slowest:
+            return
+        print(f"{len(slowest)} slowest of {len(self.records)} snippets:", file=file)
+        print(f"{'wall(s)':>9} {'cpu(s)':>9} {'peak mem':>10} {'retained':>10} {'output':>10}  {'origin':6}  location [section]", file=file)
+        for record in slowest:
+            print(f"{record.wall_time:9.4f} {record.cpu_time:9.4f} {format_size(record.peak_memory):>10} {format_size(record.retained_memory):>10} {format_size(record.output_size):>10}  {record.origin:6}  {record.location()} [{record.section}]", file=file)
+
+    def show_retained(self, file):
+        retaining = sorted( filter( lambda record : record.retained_memory > 0, self.records ), key=lambda record : record.retained_memory, reverse=True )[ : self.top_n ]
+        if not retaining:
+            return
+        total = sum( map( lambda record : record.retained_memory, self.records ) )
+        print(f"{format_size(total)} retained by {len(self.records)} snippets, most by:", file=file)
+        for record in retaining:
+            print(f"{format_size(record.retained_memory):>10}  {record.kind:16}  {record.location()} [{record.section}]", file=file)
+
+
+def format_size(num):
+    for unit in ("B", "KiB", "MiB"):
+        if num < 1024:
+            return f"{num:.0f} {unit}" if unit == "B" else f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} GiB"
+
+
+_recorder = None
+
+def get_recorder(top_n, timing=True):
+    global _recorder
+    if _recorder is None:
+        _recorder = PerfRecorder(top_n, timing)
+    _recorder.timing = _recorder.timing or timing
+    return _recorder
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+# compiles the snippets of lessons into the code cache (see codecache.py), without running the lessons:
+#
+#   python3 -m mdpyformat.precompile LESSON.py [LESSON.py ...]
+#
+# syntax errors in snippets are reported with the line number in the lesson.
+
+import sys
+from . import codecache as _codecache
+from . import snipdeps as _snipdeps
+from .cfg import MdfCfg
+
+
+def precompile_lessons(lessons):
+    """ compile the snippets of each lesson, returns the exit code: 1 if a lesson can't be parsed or a snippet has a syntax error """
+    exit_code = 0
+    for lesson in lessons:
+        if _snipdeps.lesson_snippets(lesson) is None:
+            print(f"{lesson}: can't read or parse the lesson", file=sys.stderr)
+            exit_code = 1
+            continue
+        cache = _codecache.get_cache(MdfCfg.code_cache_dir or _codecache.default_dir(lesson))
+        for line, message in _codecache.precompile(lesson, cache):
+            print(f"{lesson}:{line}: syntax error in snippet: {message}", file=sys.stderr)
+            exit_code = 1
+    return exit_code
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python3 -m mdpyformat.precompile LESSON.py [LESSON.py ...]", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(precompile_lessons(sys.argv[1:]))
@@ -0,0 +1,69 @@
+import os
+import pstats
+import cProfile
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_profiler():
+    return cProfile.Profile()
+
+def _is_own_function(func):
+    # functions of mdpyformat (capture of the output, event loop), and the call that stops the profiler, are not part of the snippet
+    file_name, _, name = func
+    return file_name.startswith(_PACKAGE_DIR) or file_name == cProfile.__file__ or "_lsprof.Profiler" in name
+
+def _is_entry(func):
+    # the eval call of mdpyformat, and the code at the top level of the snippet that it runs
+    file_name, _, name = func
+    return (file_name == "~" and name in ("<built-in method builtins.eval>", "<built-in method builtins.exec>")) or (file_name == "<string>" and name == "<module>")
+
+def _hidden_functions(stats):
+    # functions that are not part of the snippet: those of mdpyformat, and all functions that are called by them only
+    # (the entry into the snippet, the event loop that runs a snippet with await, the string methods of the output capture).
+    # The functions of the snippet are shown when the entry calls them.
+    hidden = {}
+
+    def is_hidden(func):
+        if func not in hidden:
+            # a recursive function is hidden if its other callers are
+            hidden[func] = True
+            callers = stats.stats[func][4]
+            hidden[func] = _is_own_function(func) or all( map( lambda caller : is_hidden(caller) and (_is_entry(func) or not _is_entry(caller)), callers ) )
+        return hidden[func]
+
+    return set( filter( is_hidden, stats.stats ) )
+
+def _function_label(func):
+    file_name, line, name = func
+    if file_name == "~":
+        # built-in function
+        return name
+    return f"{os.path.basename(file_name)}:{line}({name})"
+
+def hottest_functions(profiler, top, sort_key):
+    """ returns the top functions of the profile as (calls, tottime, cumtime, label), sorted by sort_key (see pstats.Stats.sort_stats) """
+    stats = pstats.Stats(profiler).sort_stats(sort_key)
+    hidden = _hidden_functions(stats)
+    rows = []
+    for func in stats.fcn_list:
+        if func in hidden:
+            continue
+        primitive_calls, calls, tottime, cumtime, _ = stats.stats[func]
+        calls_str = str(calls) if calls == primitive_calls else f"{calls}/{primitive_calls}"
+        rows.append( (calls_str, tottime, cumtime, _function_label(func)) )
+        if len(rows) == top:
+            break
+    return rows
+
+def format_table(rows):
+    """ markdown table of the rows returned by hottest_functions """
+    lines = [ "| calls | tottime (s) | cumtime (s) | function |", "|------:|------------:|------------:|:---------|" ]
+    for calls, tottime, cumtime, label in rows:
+        label = label.replace("|", "\\|")
+        lines.append(f"| {calls} | {tottime:.6f} | {cumtime:.6f} | `{label}` |")
+    return "\n".join(lines) + "\n"
+
+def pstats_path(lesson, line):
+    """ the .pstats file of the snippet at line of the lesson: next to the lesson and its markdown file """
+    return f"{os.path.splitext(lesson)[0]}.{line}.pstats"
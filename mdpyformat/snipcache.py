@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import atexit
+import threading
+
+
+class CacheStats:
+    """ hit/miss counters of a result cache, shown at the end of the build """
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        # total time spent on cache hits (reading and decoding the entry), in seconds
+        self.hit_time = 0.0
+
+    def __str__(self):
+        total = self.hits + self.misses
+        ratio = 100.0 * self.hits / total if total != 0 else 0.0
+        latency = f", {1000.0 * self.hit_time / self.hits:.2f} ms per hit" if self.hits != 0 else ""
+        return f"{self.name}: {self.hits} hits, {self.misses} misses ({ratio:.1f}% hit rate{latency})"
+
+
+class ResultCache:
+    """ on-disk cache of json serializable values, each entry is a file named by the key.
+        The least recently used entries are evicted, once the size of the cache directory grows beyond max_bytes """
+
+    def __init__(self, cache_dir, max_bytes, name):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = CacheStats(name)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum( map( lambda entry : entry.stat().st_size, self._entries() ) )
+
+    @staticmethod
+    def make_key(*parts):
+        """ returns the content hash of all argument strings """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_file(path):
+        """ returns the content hash of a file, the file is read in chunks """
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda : file.read(64 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """ returns the cached value or None. A hit marks the entry as most recently used """
+        start = time.perf_counter()
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                value = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        self.stats.hit_time += time.perf_counter() - start
+        return value
+
+    def contains(self, key):
+        """ check if there is an entry for the key, without counting it as a hit or a miss """
+        return os.path.exists(self._path(key))
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(value, file)
+            old_size = os.stat(path).st_size if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.total_bytes += os.stat(path).st_size - old_size
+        except OSError as err:
+            print(f"{self.stats.name}: can't write cache entry {path}: {err}", file=sys.stderr)
+            return
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted( self._entries(), key=lambda entry : entry.stat().st_mtime )
+        for entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.unlink(entry.path)
+                self.total_bytes -= size
+            except OSError:
+                pass
+
+    def _entries(self):
+        return filter( lambda entry : entry.is_file() and entry.name.endswith(".json"), os.scandir(self.cache_dir) )
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+
+_caches = {}
+
+def get_cache(cache_dir, max_bytes, name):
+    """ returns the cache instance for the given directory and name, the statistics of all caches used are shown on exit """
+    cache_key = (os.path.abspath(cache_dir), name)
+    cache = _caches.get(cache_key)
+    if cache is None:
+        if not _caches:
+            atexit.register(show_cache_stats)
+        cache = ResultCache(os.path.join(cache_dir, name), max_bytes, name)
+        _caches[cache_key] = cache
+    return cache
+
+def show_cache_stats():
+    """ write hit/miss statistics of all caches to standard error (standard output is the generated markdown) """
+    for cache in _caches.values():
+        print(f"{cache.stats} {cache.total_bytes} bytes in {cache.cache_dir}", file=sys.stderr)
@@ -0,0 +1,319 @@
+import ast
+import builtins
+import symtable
+
+# calls that can read or write any global variable, the names used by a snippet that calls them are not known.
+_DYNAMIC_CALLS = frozenset({"exec", "eval", "globals", "locals", "vars", "setattr", "delattr", "__import__"})
+
+# calls that list the names of the namespace, if they are called without arguments
+_NAMESPACE_CALLS = frozenset({"dir"})
+
+_BUILTIN_NAMES = frozenset(dir(builtins))
+
+# modules that have no effect outside of the snippet that imports them, and that give the same results in each process
+_PURE_MODULES = frozenset({ "abc", "bisect", "cmath", "collections", "contextlib", "copy", "dataclasses", "decimal", "enum", "fractions", "functools",
+                            "heapq", "itertools", "json", "math", "numbers", "operator", "re", "statistics", "string", "textwrap", "types", "typing" })
+
+# builtins that do input or output (other than print), or whose results differ between processes.
+# id is not one of them: the addresses it returns change from run to run anyway, comparing them gives the same result in any process.
+_IMPURE_BUILTINS = frozenset({ "breakpoint", "exit", "hash", "help", "input", "open", "quit" })
+
+# top level calls of these functions in a lesson are snippets, their first argument is the source of the snippet
+SNIPPET_FUNCTIONS = ( "eval_and_quote", "profile_and_quote", "tracemalloc_and_quote" )
+
+
+class SnippetNames:
+    """ the global names that a code snippet reads and writes.
+        A name that is loaded by the snippet may also be modified by it, via a method call or by attribute assignment.
+        is_dynamic is set for snippets that access globals in a way that can't be followed by looking at the source.
+        global_reads are the global and builtin names that the snippet refers to, without the local names of its functions and classes.
+        is_pure is set for snippets that only import modules of _PURE_MODULES, don't await at top level, and don't call builtins of _IMPURE_BUILTINS:
+        such a snippet has no effect outside of its namespace, and its output doesn't depend on the process that runs it.
+        effects maps the functions and classes defined by the snippet to the non builtin globals that they refer to (read, change or declare global):
+        a call touches these names """
+
+    def __init__(self, reads, writes, is_dynamic, global_reads=frozenset(), is_pure=False, effects=None):
+        self.reads = reads
+        self.writes = writes
+        self.is_dynamic = is_dynamic
+        self.global_reads = global_reads
+        self.is_pure = is_pure
+        self.effects = effects if effects is not None else {}
+
+    def touched(self):
+        """ all non builtin names that the snippet reads or writes """
+        return (self.reads - _BUILTIN_NAMES) | self.writes
+
+
+class _NameCollector(ast.NodeVisitor):
+
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+        self.is_dynamic = False
+        self.nesting = 0
+        # top level packages of all imported modules
+        self.imports = set()
+        self.has_top_level_await = False
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.reads.add(node.id)
+        elif self.nesting == 0:
+            self.writes.add(node.id)
+
+    def visit_Attribute(self, node):
+        # obj.x = 1 changes the object referred to by the global name obj
+        if not isinstance(node.ctx, ast.Load):
+            base = node.value
+            while isinstance(base, (ast.Attribute, ast.Subscript)):
+                base = base.value
+            if isinstance(base, ast.Name):
+                self.writes.add(base.id)
+        self.generic_visit(node)
+
+    visit_Subscript = visit_Attribute
+
+    def visit_Global(self, node):
+        self.writes.update(node.names)
+
+    def visit_Import(self, node):
+        if isinstance(node, ast.ImportFrom):
+            self.imports.add( node.module.split(".")[0] if node.level == 0 and node.module else "." )
+        else:
+            self.imports.update( map( lambda alias : alias.name.split(".")[0], node.names ) )
+        for alias in node.names:
+            if alias.name == "*":
+                self.is_dynamic = True
+            elif self.nesting == 0:
+                self.writes.add( alias.asname if alias.asname else alias.name.split(".")[0] )
+
+    visit_ImportFrom = visit_Import
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name) and (node.func.id in _DYNAMIC_CALLS or (node.func.id in _NAMESPACE_CALLS and not node.args)):
+            self.is_dynamic = True
+        self.generic_visit(node)
+
+    def _visit_scope(self, node):
+        if self.nesting == 0 and hasattr(node, "name"):
+            self.writes.add(node.name)
+        for decorator in getattr(node, "decorator_list", []):
+            self.visit(decorator)
+        self.nesting += 1
+        for field, value in ast.iter_fields(node):
+            if field == "decorator_list":
+                continue
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+        self.nesting -= 1
+
+    visit_FunctionDef = _visit_scope
+    visit_AsyncFunctionDef = _visit_scope
+    visit_ClassDef = _visit_scope
+    visit_Lambda = _visit_scope
+    visit_ListComp = _visit_scope
+    visit_SetComp = _visit_scope
+    visit_DictComp = _visit_scope
+    visit_GeneratorExp = _visit_scope
+
+    def visit_ExceptHandler(self, node):
+        if node.name is not None and self.nesting == 0:
+            self.writes.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Await(self, node):
+        if self.nesting == 0:
+            self.has_top_level_await = True
+        self.generic_visit(node)
+
+    visit_AsyncFor = visit_Await
+    visit_AsyncWith = visit_Await
+
+    def visit_NamedExpr(self, node):
+        # the target of := binds in the enclosing function (or module) scope, even inside a comprehension
+        self.writes.add(node.target.id)
+        self.visit(node.value)
+
+
+def snippet_names(arg_str):
+    """ returns the SnippetNames of a snippet, or None if the snippet can't be parsed """
+    try:
+        tree = ast.parse(arg_str)
+    except SyntaxError:
+        return None
+    collector = _NameCollector()
+    collector.visit(tree)
+    try:
+        table = symtable.symtable(arg_str, "<snippet>", "exec")
+    except SyntaxError:
+        return SnippetNames(collector.reads, collector.writes, collector.is_dynamic)
+    global_reads = _global_names(table, lambda symbol : symbol.is_referenced())
+    is_pure = not collector.is_dynamic and not collector.has_top_level_await and collector.imports <= _PURE_MODULES and not global_reads & _IMPURE_BUILTINS
+    effects = {}
+    for child in filter( lambda child : child.get_name() in collector.writes, table.get_children() ):
+        effects.setdefault(child.get_name(), set()).update( _global_names(child, lambda symbol : True) - _BUILTIN_NAMES )
+    return SnippetNames(collector.reads, collector.writes, collector.is_dynamic, global_reads, is_pure, effects)
+
+def _global_names(table, predicate):
+    # the names of the symbols that are globals in the table or any of its nested scopes, and that match the predicate
+    names = set()
+    tables = [ table ]
+    while tables:
+        table = tables.pop()
+        names.update( map( lambda symbol : symbol.get_name(), filter( lambda symbol : symbol.is_global() and predicate(symbol), table.get_symbols() ) ) )
+        tables.extend(table.get_children())
+    return names
+
+
+_lesson_names = {}
+
+def lesson_names(file_name):
+    """ returns all names that are used by the code of a lesson file (code in snippet strings is not included), None if the file can't be read. """
+    if file_name not in _lesson_names:
+        names = None
+        try:
+            with open(file_name, "r", encoding="utf-8") as file:
+                tree = ast.parse(file.read())
+            names = set( map( lambda node : node.id, filter( lambda node : isinstance(node, ast.Name), ast.walk(tree) ) ) )
+            # names bound by import statements and definitions of the lesson code
+            names.update( map( lambda node : node.name, filter( lambda node : isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)), ast.walk(tree) ) ) )
+            for node in filter( lambda node : isinstance(node, (ast.Import, ast.ImportFrom)), ast.walk(tree) ):
+                names.update( map( lambda alias : alias.asname if alias.asname else alias.name.split(".")[0], node.names ) )
+        except (OSError, SyntaxError, ValueError):
+            pass
+        _lesson_names[file_name] = names
+    return _lesson_names[file_name]
+
+
+class SnippetNode:
+    """ a snippet in the dependency graph of a lesson """
+
+    def __init__(self, index, source, names, deps, key, touched=frozenset()):
+        self.index = index
+        self.source = source
+        self.names = names
+        # the names touched by the snippet, including those touched by the functions it calls (see SnippetGraph)
+        self.touched = touched
+        # indexes of the preceding snippets that this snippet depends on directly
+        self.deps = deps
+        # hash over the source of this snippet and the keys of all snippets it depends on
+        self.key = key
+
+
+class SnippetGraph:
+    """ dependency graph of the snippets of a lesson. A snippet depends on the last preceding snippet that touched any of its names.
+        A snippet with dynamic access to globals depends on everything before it, and everything after it depends on it.
+        A snippet that uses a function or class defined by an earlier snippet also touches the globals that the function refers to:
+        calling it may change them (global declarations, appending to a module level list). A name assigned by a snippet takes over the effects
+        of the functions the snippet used, so that calling a method of an object touches the globals that the methods of its class refer to.
+        Effects that are passed around in other ways (functions stored in containers, objects passed as arguments) are not followed. """
+
+    def __init__(self, make_key):
+        self.make_key = make_key
+        self.nodes = []
+        self.last_touched = {}
+        self.last_dynamic = None
+        # names of functions, classes and objects defined by the snippets, mapped to the globals touched by using them
+        self.effects = {}
+
+    def add(self, arg_str):
+        """ add the next snippet of the lesson, returns its SnippetNode """
+        index = len(self.nodes)
+        names = snippet_names(arg_str)
+
+        deps = set()
+        touched = frozenset()
+        if self.last_dynamic is not None:
+            deps.add(self.last_dynamic)
+        if names is None or names.is_dynamic:
+            deps.update(self.last_touched.values())
+            self.last_dynamic = index
+        else:
+            effects = self._expand_effects(names.touched())
+            touched = frozenset(names.touched() | effects)
+            for name in touched:
+                if name in self.last_touched:
+                    deps.add(self.last_touched[name])
+                self.last_touched[name] = index
+            for name in names.writes:
+                self.effects[name] = names.effects.get(name, effects)
+
+        key = self.make_key(arg_str, *sorted( map( lambda dep : self.nodes[dep].key, deps ) ))
+        node = SnippetNode(index, arg_str, names, deps, key, touched)
+        self.nodes.append(node)
+        return node
+
+    def is_self_contained(self, index):
+        """ true if the snippet at index and all snippets it depends on are pure (see SnippetNames.is_pure), and each of them refers only to builtins
+            and to names defined by itself or by the snippets before it. Such a snippet shows the same output, if it runs after these snippets
+            in a new namespace, in another process """
+        defined = set(_BUILTIN_NAMES)
+        for dep in sorted(self.upstream(index) | { index }):
+            names = self.nodes[dep].names
+            if names is None or not names.is_pure:
+                return False
+            defined |= names.writes
+            if not names.global_reads <= defined:
+                return False
+        return True
+
+    def _expand_effects(self, names):
+        # the globals touched by using the functions and objects among names, and by the functions they refer to in turn
+        result = set()
+        to_visit = list(names)
+        while to_visit:
+            for name in self.effects.get(to_visit.pop(), ()):
+                if name not in result:
+                    result.add(name)
+                    to_visit.append(name)
+        return result
+
+    def upstream(self, index):
+        """ returns the set of indexes of all snippets that the snippet at index depends on (directly or indirectly) """
+        result = set()
+        to_visit = list(self.nodes[index].deps)
+        while to_visit:
+            dep = to_visit.pop()
+            if dep not in result:
+                result.add(dep)
+                to_visit.extend(self.nodes[dep].deps)
+        return result
+
+
+class LessonSnippet:
+    """ a snippet found in the source of a lesson file """
+
+    def __init__(self, source, keywords, lineno, func_name="eval_and_quote"):
+        self.source = source
+        # names of the keyword arguments passed to the call
+        self.keywords = keywords
+        self.lineno = lineno
+        # name of the called function
+        self.func_name = func_name
+
+
+def lesson_snippets(file_name, func_names=("eval_and_quote",)):
+    """ returns a LessonSnippet for each string literal passed to a top level call of one of func_names in the lesson file, in source order.
+        An entry is None, if the argument of that call is not a string literal. Returns None if the file can't be parsed. """
+    if file_name is None:
+        return None
+    try:
+        with open(file_name, "r", encoding="utf-8") as file:
+            tree = ast.parse(file.read())
+    except (OSError, SyntaxError, ValueError):
+        return None
+    snippets = []
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) and isinstance(stmt.value.func, ast.Name) and stmt.value.func.id in func_names:
+            args = stmt.value.args
+            if len(args) >= 1 and isinstance(args[0], ast.Constant) and isinstance(args[0].value, str):
+                keywords = list( map( lambda keyword : keyword.arg, stmt.value.keywords ) )
+                snippets.append(LessonSnippet(args[0].value, keywords, stmt.lineno, stmt.value.func.id))
+            else:
+                snippets.append(None)
+    return snippets
@@ -0,0 +1,158 @@
+# sub-interpreter backend for parallel snippets (python 3.12 and later)
+#
+# Each snippet runs, together with the chain of snippets that it depends on, in an isolated sub-interpreter that has its own GIL.
+# The interpreters are created once and reused: each run gets a new namespace, modules that were imported stay loaded.
+# The sub-interpreter doesn't see the globals of the lesson; a snippet that fails there (for example because it uses a name defined by the lesson code)
+# is evaluated in-process instead, so that its error is shown as usual.
+
+import os
+import sys
+import json
+import queue
+import tempfile
+import threading
+import concurrent.futures
+from . import capture as _capture
+
+try:
+    if sys.version_info < (3, 12):
+        raise ImportError("sub-interpreters with their own GIL need python 3.12")
+    try:
+        import _interpreters as _interp_api
+    except ImportError:
+        import _xxsubinterpreters as _interp_api
+except ImportError:
+    _interp_api = None
+
+# modules imported by each interpreter when it is created (modules that can't be loaded in a sub-interpreter are skipped)
+PRELOAD_MODULES = ( "collections", "functools", "itertools", "math", "re", "json", "dataclasses", "typing" )
+
+_PRELUDE = """
+import sys, importlib, importlib.util
+sys.path[:] = {path!r}
+for name in {modules!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+# capture.py is loaded by itself: importing the mdpyformat package would set up the lesson machinery (document, exit functions)
+spec = importlib.util.spec_from_file_location("_mdf_capture", {capture_path!r})
+sys.modules["_mdf_capture"] = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(sys.modules["_mdf_capture"])
+del spec
+"""
+
+# runs a chain of snippets in a new namespace, the output of the last snippet is captured as by eval_and_quote (see capture.OutputSink)
+_RUN = """
+def _mdf_run(sources, max_lines, result_path):
+    import sys, ast, inspect, builtins, json
+    capture = sys.modules["_mdf_capture"]
+    result = None
+    namespace = {{ "__name__" : "__main__", "__builtins__" : builtins }}
+    old_out, old_err = sys.stdout, sys.stderr
+    try:
+        for index, source in enumerate(sources):
+            is_last = index == len(sources) - 1
+            out_sink = capture.OutputSink(">> ", max_lines)
+            err_sink = capture.OutputSink(">> ", max_lines)
+            sys.stdout, sys.stderr = out_sink, err_sink
+            try:
+                code = compile(source, "<string>", "exec", flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+                if code.co_flags & inspect.CO_COROUTINE:
+                    # top level await needs the event loop of the lesson
+                    break
+                exec(code, namespace)
+            finally:
+                sys.stdout, sys.stderr = old_out, old_err
+            if is_last:
+                result = [ out_sink.close_output(), err_sink.close_output() ]
+    except BaseException:
+        result = None
+    with open(result_path, "w", encoding="utf-8") as file:
+        json.dump(result, file)
+
+_mdf_run({sources!r}, {max_lines!r}, {result_path!r})
+del _mdf_run
+"""
+
+
+def available():
+    """ true if this python has sub-interpreters with their own GIL """
+    return _interp_api is not None
+
+def _create():
+    try:
+        return _interp_api.create("isolated")
+    except TypeError:
+        return _interp_api.create(isolated=True)
+
+def _run_string(interp_id, script):
+    # python 3.13 returns information on an uncaught exception, python 3.12 raises RunFailedError.
+    # The scripts of this module catch all exceptions, an error here means that the interpreter itself failed.
+    try:
+        return _interp_api.run_string(interp_id, script) is None
+    except Exception:
+        return False
+
+
+class InterpreterPool:
+    """ warm sub-interpreters, each one is owned by a thread of the pool: it is created, runs snippets and is destroyed in that thread
+        (an interpreter that imported threading can't be destroyed by another thread) """
+
+    def __init__(self, num_interpreters=None):
+        self.requests = queue.SimpleQueue()
+        self.threads = []
+        for index in range(num_interpreters or os.cpu_count() or 1):
+            thread = threading.Thread(target=self._serve, name=f"mdf-interpreter-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, sources, max_lines):
+        """ run the snippets in a sub-interpreter, the future is set to (stdout, stderr) of the last one, or to None if the snippets can't be run there """
+        future = concurrent.futures.Future()
+        self.requests.put( (future, list(sources), max_lines) )
+        return future
+
+    def _serve(self):
+        interp_id = _create()
+        try:
+            _run_string(interp_id, _PRELUDE.format(path=list(sys.path), modules=PRELOAD_MODULES, capture_path=_capture.__file__))
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    return
+                future, sources, max_lines = request
+                if future.set_running_or_notify_cancel():
+                    future.set_result(_run(interp_id, sources, max_lines))
+        finally:
+            _interp_api.destroy(interp_id)
+
+    def close(self):
+        """ cancel the snippets that didn't start yet, wait for the running ones, and destroy the interpreters """
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request[0].cancel()
+        for _ in self.threads:
+            self.requests.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+def _run(interp_id, sources, max_lines):
+    fd, result_path = tempfile.mkstemp(prefix="mdf-interp-", suffix=".json")
+    os.close(fd)
+    try:
+        if not _run_string(interp_id, _RUN.format(sources=sources, max_lines=max_lines, result_path=result_path)):
+            return None
+        with open(result_path, "r", encoding="utf-8") as file:
+            result = json.load(file)
+        return tuple(result) if result is not None else None
+    except (OSError, ValueError):
+        return None
+    finally:
+        os.unlink(result_path)
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import math
+import timeit
+import atexit
+import statistics
+
+# two sided 95% quantiles of the t distribution, by degrees of freedom (1.96 for more than 30)
+_T_95 = { 1 : 12.706, 2 : 4.303, 3 : 3.182, 4 : 2.776, 5 : 2.571, 6 : 2.447, 7 : 2.365, 8 : 2.306, 9 : 2.262, 10 : 2.228,
+          11 : 2.201, 12 : 2.179, 13 : 2.160, 14 : 2.145, 15 : 2.131, 16 : 2.120, 17 : 2.110, 18 : 2.101, 19 : 2.093, 20 : 2.086,
+          21 : 2.080, 22 : 2.074, 23 : 2.069, 24 : 2.064, 25 : 2.060, 26 : 2.056, 27 : 2.052, 28 : 2.048, 29 : 2.045, 30 : 2.042 }
+
+
+class TimingResult:
+    """ the samples of one variant, each sample is the time of a single loop in seconds """
+
+    def __init__(self, label, key, number, samples):
+        self.label = label
+        self.key = key
+        self.number = number
+        self.samples = samples
+        self.min = min(samples)
+        self.median = statistics.median(samples)
+        self.mean = statistics.fmean(samples)
+        self.stdev = statistics.stdev(samples) if len(samples) > 1 else 0.0
+        # 95% confidence interval of the mean. With few noisy samples it may reach below zero, a duration can't.
+        t_value = _T_95.get(len(samples) - 1, 1.96)
+        half_width = t_value * self.stdev / math.sqrt(len(samples))
+        self.ci_low = max(0.0, self.mean - half_width)
+        self.ci_high = self.mean + half_width
+        # median of the previous build, if it was stored
+        self.previous = None
+
+    def change(self):
+        """ relative change of the median against the previous build, or None """
+        if not self.previous:
+            return None
+        return self.median / self.previous - 1.0
+
+
+def measure(stmt, setup, globals_dict, repeat, number=None):
+    """ time the statement as timeit does: the loop count is auto-ranged (so that a sample takes at least 0.2 seconds), unless number is given.
+        returns (number, samples), each sample is the time of one loop in seconds """
+    timer = timeit.Timer(stmt, setup, globals=globals_dict)
+    if number is None:
+        number, _ = timer.autorange()
+    samples = list( map( lambda total : total / number, timer.repeat(repeat, number) ) )
+    return number, samples
+
+
+def format_time(seconds):
+    for unit, scale in ( ("s", 1.0), ("ms", 1e-3), ("µs", 1e-6) ):
+        if abs(seconds) >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+def format_table(results, threshold):
+    """ markdown table that compares the variants; with a previous build, the change of the median is shown and regressions beyond threshold are marked """
+    with_change = any( map( lambda result : result.previous, results ) )
+    header = "| variant | loops | min | median | stdev | 95% CI of mean |"
+    align = "|:--------|------:|----:|-------:|------:|:---------------|"
+    if with_change:
+        header += " change |"
+        align += "-------:|"
+    lines = [ header, align ]
+    for result in results:
+        line = f"| {result.label} | {result.number} | {format_time(result.min)} | {format_time(result.median)} | {format_time(result.stdev)} | {format_time(result.ci_low)} .. {format_time(result.ci_high)} |"
+        if with_change:
+            change = result.change()
+            if change is None:
+                line += " |"
+            else:
+                line += f" {change:+.1%}{' __regression__' if change > threshold else ''} |"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+class TimingStore:
+    """ medians of the timed variants of a lesson, by key of the variant. Loaded from LESSON.timing.json, the new results are written back at exit """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                self.previous = json.load(file)
+        except (OSError, ValueError):
+            self.previous = {}
+        self.current = {}
+        atexit.register(self.save)
+
+    def add(self, result):
+        """ record the result, and set its previous median """
+        entry = self.previous.get(result.key)
+        if entry is not None:
+            result.previous = entry["median"]
+        self.current[result.key] = { "label" : result.label, "number" : result.number, "min" : result.min, "median" : result.median, "stdev" : result.stdev }
+
+    def save(self):
+        if not self.current:
+            return
+        entries = dict(self.previous)
+        entries.update(self.current)
+        try:
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump(entries, file, indent=2)
+        except OSError as err:
+            print(f"can't write {self.path}: {err}", file=sys.stderr)
+
+
+_stores = {}
+
+def get_store(lesson):
+    path = os.path.splitext(lesson)[0] + ".timing.json"
+    store = _stores.get(path)
+    if store is None:
+        store = TimingStore(path)
+        _stores[path] = store
+    return store
@@ -5,70 +5,142 @@
 
 import sys
 import re
-
+import shutil
+import tempfile
+import contextlib
+
+
+# marks the place of the table of contents in the output pieces of _processPieces: after the line that contains 'Table of Contents'
+_TOC_MARK = object()
+
+_FENCE = "```"
+
+
+def _open(file, mode):
+    # file is either a file name, or a file object that is used as is (and not closed)
+    if isinstance(file, str):
+        return open(file, mode)
+    return contextlib.nullcontext(file)
+
+@contextlib.contextmanager
+def _rereadable(in_file):
+    # the input is read twice: a file name is opened for each pass, a file object is rewound.
+    # Input that can't be rewound (a pipe) is first copied to a temporary file.
+    if isinstance(in_file, str):
+        yield lambda : open(in_file, "r")
+        return
+    if in_file.seekable():
+        start = in_file.tell()
+        def rewind():
+            in_file.seek(start)
+            return contextlib.nullcontext(in_file)
+        yield rewind
+        return
+    with tempfile.TemporaryFile("w+", newline="") as spool:
+        shutil.copyfileobj(in_file, spool)
+        def rewind_spool():
+            spool.seek(0)
+            return contextlib.nullcontext(spool)
+        yield rewind_spool
 
 def processFile(in_file, out_file):
+    """ add a table of contents to the markdown in in_file, and write it to out_file. Both arguments are file names or file objects.
+        The input is read twice, line by line: the first pass collects the table of contents and finds its place, the second pass writes the output """
 
-    with open (in_file, "r") as in_file:
-        in_file_data = in_file.read()
-
-    with open(out_file, "w") as newFile:
+    with _rereadable(in_file) as reopen:
         toc = []
-        levels = [0,0,0,0,0]
-        tempFile = []
-        tocLoc = 0
+        tocMarks = 0
+        with reopen() as lines:
+            for piece in _processPieces(lines, toc):
+                if piece is _TOC_MARK:
+                    tocMarks += 1
+
+        # the table of contents goes after the last line with 'Table of Contents', or at the start
+        with _open(out_file, "w") as newFile:
+            if tocMarks == 0:
+                _writeToc(newFile, toc)
+            with reopen() as lines:
+                marks = 0
+                for piece in _processPieces(lines, []):
+                    if piece is _TOC_MARK:
+                        marks += 1
+                        if marks == tocMarks:
+                            _writeToc(newFile, toc)
+                    else:
+                        newFile.write(piece)
+
+def _writeToc(newFile, toc):
+    for line in toc:
+        newFile.write(line)
+    newFile.write("\n")
+
+def _processPieces(lines, toc):
+    # yields the output for the input lines, without the table of contents, and _TOC_MARK where it may go. The headers are added to toc.
+    # The input is split on ``` anywhere in a line: text between the fences is processed line by line (the text before a fence counts as a line),
+    # the sections between the fences are copied as is. An unclosed section is closed at the end, a fence at the very end of the input is dropped.
+    levels = [0,0,0,0,0]
+    partOfToc = False
+    is_text = True
+    # the text of the current line before the current position (text section), or whether the code section has any text (code section)
+    text_line = ""
+    has_code = False
+    # true if the input ends right after a fence
+    at_fence = False
+
+    def processLine(line):
+        nonlocal partOfToc
+        if partOfToc and line != '\n':
+            return
         partOfToc = False
-
-        is_text = True
-
-        section_start = 0
-
-        while True:
-            section_end = in_file_data.find("```", section_start)
-            if section_end == -1:
-                section_end = len(in_file_data)
-            text_section = in_file_data[  section_start : section_end ]
-            section_start = section_end + 3
-
-            #print( f"is_text: {is_text} section_end: {section_end} text_section: {text_section}")
-
+        if 'Table of Contents' in line:
+            yield line
+            yield _TOC_MARK
+            partOfToc = True
+            return
+        if line[0] == '#':
+            secId = buildToc(line, toc, levels)
+            line = addSectionTag(cleanLine(line), secId) + '\n'
+        yield line
+
+    for input_line in lines:
+        pos = 0
+        while pos < len(input_line):
+            at_fence = False
+            fence = input_line.find(_FENCE, pos)
+            end = fence if fence != -1 else len(input_line)
             if is_text:
-                is_text = False
-
-                for line in text_section.split('\n'):
-                    line = line + '\n'
-
-                    if partOfToc and line != '\n':
-                        continue
-                    else:
-                        partOfToc = False
-                    if 'Table of Contents' in line:
-                        tocLoc = len(tempFile) + 1
-                        partOfToc = True
-                    elif line[0] == '#':
-                        secId = buildToc(line, toc, levels)
-                        line = addSectionTag(cleanLine(line), secId) + '\n'
-                    tempFile.append(line)
-
+                if fence == -1 and input_line.endswith("\n"):
+                    yield from processLine(text_line + input_line[pos : ])
+                    text_line = ""
+                elif fence == -1:
+                    text_line += input_line[pos : ]
+                else:
+                    yield from processLine(text_line + input_line[pos : end] + "\n")
+                    text_line = ""
+                    is_text = False
+                    has_code = False
             else:
-                is_text = True
-                tempFile.append("```")
-                tempFile.append(text_section)
-                tempFile.append("```")
-
-            if section_start >= len(in_file_data):
+                if end > pos:
+                    if not has_code:
+                        yield _FENCE
+                        has_code = True
+                    yield input_line[pos : end]
+                if fence != -1:
+                    if not has_code:
+                        yield _FENCE
+                    yield _FENCE
+                    is_text = True
+            if fence == -1:
                 break
-
-        for line in toc:
-            tempFile.insert(tocLoc, line)
-            tocLoc += 1
-        tempFile.insert(tocLoc, "\n")
-
-        #don't know, if that is of benefit.
-        #tempFile.insert(0, '" Set text width as 72.' + "\n")
-
-        for line in tempFile:
-            newFile.write(line)
+            pos = fence + len(_FENCE)
+            at_fence = True
+
+    if is_text:
+        # the last line of text; nothing is added if the input ends with a fence (but an empty input gives an empty line)
+        if not at_fence:
+            yield from processLine(text_line + "\n")
+    elif has_code:
+        yield _FENCE
 
 
 def addSectionTag(line, secId):
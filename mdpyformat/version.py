@@ -0,0 +1,2 @@
+# version of the mdpyformat package, keep in sync with pip-build/setup.py
+VERSION = "1.0.3"
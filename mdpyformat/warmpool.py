@@ -0,0 +1,151 @@
+# warm interpreter pool for run_and_quote
+#
+# A zygote process (zygote.py) imports the commonly used standard modules once, and keeps a few forked workers waiting.
+# Each request is handed to a waiting worker: the worker runs the python file in a new __main__ module, and exits.
+# Standard output and standard error of the worker go to a pipe, the client copies them to the output while the file is running.
+
+import os
+import sys
+import shlex
+import shutil
+import socket
+import atexit
+import threading
+import subprocess
+from . import capture as _capture
+from . import zygote as _zygote
+
+
+class WarmPool:
+    """ client of the zygote process, runs python files in warm workers. Several threads can run files at the same time """
+
+    def __init__(self, num_workers):
+        # the zygote runs as a script, it doesn't import this package. Requests and responses go over a unix domain socket, on its standard input.
+        self.sock, zygote_sock = socket.socketpair()
+        try:
+            self.process = subprocess.Popen([ sys.executable, _zygote.__file__, str(num_workers) ], stdin=zygote_sock)
+        finally:
+            zygote_sock.close()
+        self.next_id = 0
+        # responses arrive in the order in which the workers finish: one waiting thread reads them, and hands them to the others.
+        self.condition = threading.Condition()
+        self.responses = {}
+        self.reading = False
+        self.broken = False
+
+    def run(self, file_name, output, max_bytes=None, args=()):
+        """ run the python file in a warm worker, its output is written to output while it runs (see capture.copy_chunks for max_bytes).
+            returns the exit code, or None if the zygote is gone before the file is run """
+        read_fd, write_fd = os.pipe()
+        try:
+            with self.condition:
+                self.next_id += 1
+                request_id = self.next_id
+                request = { "id" : request_id, "file" : file_name, "args" : list(args), "cwd" : os.getcwd(), "env" : dict(os.environ) }
+                try:
+                    _zygote.send_message(self.sock, request, [ write_fd ])
+                except OSError:
+                    return None
+                finally:
+                    # the worker holds the write end now, the pipe ends when the worker (and any process that it started) is done.
+                    os.close(write_fd)
+            with open(read_fd, "rb", buffering=0, closefd=False) as pipe:
+                dropped = _capture.copy_chunks(pipe.read, output, max_bytes)
+            if dropped:
+                output.write("\n" + _capture.cut_off_marker(dropped) + "\n")
+            response = self._wait_response(request_id)
+            if response is None:
+                # the file has run already, it is not run again: the exit code is lost with the zygote.
+                output.write("\nwarm pool: the zygote exited, the exit code of the worker is not known\n")
+                return 1
+            return response["exit_code"]
+        finally:
+            os.close(read_fd)
+
+    def _wait_response(self, request_id):
+        with self.condition:
+            while request_id not in self.responses:
+                if self.broken:
+                    return None
+                if self.reading:
+                    self.condition.wait()
+                    continue
+                self.reading = True
+                self.condition.release()
+                try:
+                    response, _ = _zygote.receive_message(self.sock)
+                except (OSError, EOFError):
+                    response = None
+                finally:
+                    self.condition.acquire()
+                    self.reading = False
+                if response is not None:
+                    self.responses[response["id"]] = response
+                else:
+                    self.broken = True
+                self.condition.notify_all()
+            return self.responses.pop(request_id)
+
+    def shutdown(self):
+        try:
+            self.sock.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+_pool = None
+# pools inherited from the parent process after a fork, only the parent talks to the zygote.
+_inherited_pools = []
+
+def get_warm_pool(num_workers):
+    global _pool
+    if _pool is None:
+        _pool = WarmPool(num_workers)
+    return _pool
+
+def _shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+def _forget_pool():
+    global _pool
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+        _pool = None
+
+atexit.register(_shutdown_pool)
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+# path of the interpreter started by a command, by command
+_interpreters = {}
+
+def interpreter_of(command):
+    """ path of the python interpreter that is started by command, or an empty string if command doesn't start a python interpreter (or has options) """
+    interpreter = _interpreters.get(command)
+    if interpreter is None:
+        args = shlex.split(command)
+        path = shutil.which(args[0]) if len(args) == 1 else None
+        if path is None or not os.path.basename(path).startswith("python"):
+            interpreter = ""
+        elif os.path.realpath(path) == os.path.realpath(sys.executable):
+            interpreter = path
+        else:
+            # the command may be a wrapper (like a pyenv shim), ask the interpreter once.
+            try:
+                interpreter = subprocess.run([ path, "-c", "import sys; print(sys.executable)" ], capture_output=True, text=True, timeout=30).stdout.strip()
+            except (OSError, subprocess.SubprocessError):
+                interpreter = ""
+        _interpreters[command] = interpreter
+    return interpreter
+
+def can_run(command):
+    """ true if command starts the python interpreter that is running this process (without any options), so that a warm worker can run the file instead """
+    if not hasattr(os, "fork") or sys.platform == "win32":
+        return False
+    interpreter = interpreter_of(command)
+    return interpreter != "" and os.path.realpath(interpreter) == os.path.realpath(sys.executable)
+
@@ -0,0 +1,238 @@
+# zygote of the warm interpreter pool for run_and_quote (see warmpool.py)
+#
+#   python3 zygote.py NUM_WORKERS
+#
+# The zygote imports the commonly used standard modules once, and keeps a few forked workers waiting.
+# Each request is handed to a waiting worker: the worker runs the python file in a new __main__ module, and exits.
+# A new worker is forked in its place. Standard output and standard error of the worker go to the pipe that is passed with the request.
+#
+# This file runs as a script, it doesn't import the mdpyformat package: the workers hold no state of mdpyformat, and exit like a new interpreter
+# does, that runs the same file. The only exit functions that they inherit are those of the preloaded standard modules.
+#
+# Requests and responses are json messages on a unix domain socket (standard input of the zygote), each one starts with its size.
+# The pipe for the output is passed along with the request (SCM_RIGHTS), from the client to the zygote, and from there to the worker.
+
+import os
+import sys
+import io
+import json
+import runpy
+import types
+import struct
+import signal
+import select
+import socket
+import importlib
+import importlib.machinery
+import traceback
+
+PRELOAD_MODULES = ( "abc", "argparse", "asyncio", "collections", "copy", "dataclasses", "datetime", "enum", "functools", "inspect", "io", "itertools",
+                    "json", "math", "pathlib", "random", "re", "string", "textwrap", "time", "typing", "weakref" )
+
+# each message starts with the size of its json text
+_HEADER = struct.Struct("!I")
+
+
+def send_message(sock, msg, fds=()):
+    """ send a json message, with the file descriptors fds attached to it """
+    data = json.dumps(msg).encode("utf-8")
+    socket.send_fds(sock, [ _HEADER.pack(len(data)) ], list(fds))
+    sock.sendall(data)
+
+def receive_message(sock):
+    """ returns the next message and the file descriptors attached to it, the message is None at the end of the stream """
+    header, fds, _, _ = socket.recv_fds(sock, _HEADER.size, 4)
+    header += _receive_exact(sock, _HEADER.size - len(header)) if header else b""
+    if len(header) < _HEADER.size:
+        return None, fds
+    data = _receive_exact(sock, _HEADER.unpack(header)[0])
+    return json.loads(data), fds
+
+def _receive_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("connection closed within a message")
+        data += chunk
+    return data
+
+def _exit_code(ex):
+    # exit status of the process, for sys.exit(code)
+    if ex.code is None:
+        return 0
+    if isinstance(ex.code, int):
+        return ex.code
+    print(ex.code, file=sys.stderr)
+    return 1
+
+def _print_exception(ex, file_name):
+    # as the interpreter does for an uncaught exception: the frames of runpy and of the worker are not shown
+    tb = ex.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != file_name:
+        tb = tb.tb_next
+    traceback.print_exception(type(ex), ex, tb)
+
+def _run_main(path):
+    # a new __main__ module for the script, as the interpreter does. runpy.run_path would set sys.argv[0] to the absolute path
+    if not os.path.isfile(path):
+        # directory or zip file with a __main__.py
+        runpy.run_path(path, run_name="__main__")
+        return
+    with io.open_code(path) as file:
+        code = compile(file.read(), path, "exec")
+    module = types.ModuleType("__main__")
+    module.__file__ = path
+    module.__cached__ = None
+    module.__loader__ = importlib.machinery.SourceFileLoader("__main__", path)
+    sys.modules["__main__"] = module
+    exec(code, module.__dict__)
+
+def _run_file(request, base_path):
+    file_name = request["file"]
+    # as in a new interpreter, __file__ of the script is an absolute path.
+    path = os.path.abspath(os.path.join(request["cwd"], file_name))
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    sys.argv = [ file_name ] + request["args"]
+    sys.path[:] = [ os.path.dirname(os.path.realpath(path)) ] + base_path
+
+    try:
+        _run_main(path)
+    except SystemExit as ex:
+        return _exit_code(ex)
+    except BaseException as ex:
+        _print_exception(ex, path)
+        return 1
+    return 0
+
+def _worker_main(sock, base_path):
+    # the worker leaves by sys.exit: the interpreter waits for the threads of the script, runs its exit functions and flushes the output, as on the exit of a new interpreter
+    request, fds = receive_message(sock)
+    sock.close()
+    if request is None:
+        # the zygote is shutting down
+        sys.exit(0)
+
+    os.dup2(fds[0], 1)
+    os.dup2(fds[0], 2)
+    os.close(fds[0])
+
+    sys.exit(_run_file(request, base_path))
+
+
+class _Zygote:
+    """ keeps num_workers forked workers waiting for a request, reports the exit code of each worker """
+
+    def __init__(self, sock, num_workers, base_path):
+        self.sock = sock
+        self.num_workers = num_workers
+        self.base_path = base_path
+        # waiting workers: (pid, socket for the request)
+        self.idle = []
+        # request id of each running worker, by pid
+        self.running = {}
+        # requests that wait for a worker to be forked: (request, output pipe)
+        self.pending = []
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        signal.signal(signal.SIGCHLD, lambda _signum, _frame : None)
+        signal.set_wakeup_fd(self.wake_w)
+
+    def fork_worker(self):
+        # returns (pid, socket for the request). In the new worker it returns (0, socket of the worker): the worker goes back to the top level
+        # of the script (see serve), before it runs the request, so that no frame of the zygote is left to unwind into when the worker exits.
+        request_sock, worker_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            # a worker must not keep the sockets of the client and of the other workers open: they would not see the zygote exit.
+            # Nor does it keep the output pipes of the requests that wait for a worker.
+            for fd in [ self.wake_r, self.wake_w ] + list( map( lambda pending : pending[1], self.pending ) ):
+                os.close(fd)
+            for other in [ self.sock, request_sock ] + list( map( lambda worker : worker[1], self.idle ) ):
+                other.close()
+            return 0, worker_sock
+        worker_sock.close()
+        return pid, request_sock
+
+    def dispatch(self, request, out_fd):
+        # the request goes to a waiting worker; if there is none, it waits in pending until serve forks one
+        while self.idle:
+            pid, request_sock = self.idle.pop(0)
+            try:
+                send_message(request_sock, request, [ out_fd ])
+            except OSError:
+                # the worker is gone, try the next one
+                continue
+            finally:
+                request_sock.close()
+            os.close(out_fd)
+            self.running[pid] = request["id"]
+            return
+        self.pending.append( (request, out_fd) )
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            request_id = self.running.pop(pid, None)
+            if request_id is not None:
+                send_message(self.sock, { "id" : request_id, "exit_code" : os.waitstatus_to_exitcode(status) })
+
+    def serve(self):
+        """ runs until the client closes the socket, returns None. In a forked worker it returns the socket of the worker """
+        while True:
+            while self.pending or len(self.idle) < self.num_workers:
+                pid, sock = self.fork_worker()
+                if pid == 0:
+                    return sock
+                self.idle.append( (pid, sock) )
+                if self.pending:
+                    self.dispatch(*self.pending.pop(0))
+            readable, _, _ = select.select([ self.sock, self.wake_r ], [], [])
+            if self.wake_r in readable:
+                try:
+                    while os.read(self.wake_r, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+            self.reap()
+            if self.sock in readable:
+                request, fds = receive_message(self.sock)
+                if request is None:
+                    break
+                self.dispatch(request, fds[0])
+        for _, request_sock in self.idle:
+            request_sock.close()
+        return None
+
+
+def _zygote_main(num_workers):
+    # sys.path of the script: like that of a new interpreter, without the directory of this file, that python put first
+    base_path = sys.path[1:]
+    sys.path[:] = base_path
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    # the socket moves off standard input, that becomes /dev/null for the workers.
+    sock = socket.socket(fileno=os.dup(0))
+    null_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null_fd, 0)
+    os.close(null_fd)
+    worker_sock = _Zygote(sock, num_workers, base_path).serve()
+    if worker_sock is not None:
+        # a forked worker, it runs its request here and exits like a new interpreter
+        _worker_main(worker_sock, base_path)
+
+if __name__ == "__main__":
+    _zygote_main(int(sys.argv[1]))
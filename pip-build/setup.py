@@ -7,7 +7,7 @@ def read(fname):
 
 install_requires = read("requirements.txt")
 install_requires = install_requires.split("\n")
-install_requires = list(filter(lambda x: x[0:1] != "#", install_requires))
+install_requires = list(filter(lambda x: x[0:1] not in ("#", ""), install_requires))
 print("install-requires:", install_requires)
 
 setuptools.setup(
@@ -31,5 +31,5 @@ setuptools.setup(
         "Topic :: Text Processing",
         "Topic :: Software Development :: Documentation"
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.9',
 )
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 from mdpyformat import *
+import inspect
 import pprintex
 
 
@@ -86,7 +87,7 @@ class Foo(Base):
 # Make a new object instance of type Foo class.
 foo_obj=Foo()
 
-""")
+""", exports=["Base", "Foo", "foo_obj"])
 
 print_md("The memory address of object foo_obj is returned by the [id built-in](https://docs.python.org/3/library/functions.html#id)")
 
@@ -124,12 +125,12 @@ print_md("""
 The getattr builtin function has a good part, its return value can be checked for None. This can be used, in order to check if the argument is an object with a __dict__ attribute.
 """)
 
-eval_and_quote("""base_obj = object()""")
+eval_and_quote("""base_obj = object()""", exports=["base_obj"])
 
 print_md("An object of built-in type ", type(base_obj), " doesn't have a __dict__ member")
 eval_and_quote("""assert getattr(base_obj, '__dict__', None) is None""")
 
-eval_and_quote("""int_obj = 42""")
+eval_and_quote("""int_obj = 42""", exports=["int_obj"])
 
 print_md("An object of built-in type ", type(int_obj), " doesn't have a __dict__ member")
 
@@ -158,7 +159,7 @@ print("class of object foo_obj - type(foo_obj): ", type(foo_obj))
 
 # That's the same as showing the __class__ member of the variable (in Python3)
 print("foo_obj.__class__ :", foo_obj.__class__)
-""")
+""", exports=["foo_obj"])
 
 print_md("""
 The class is an object, it's purpose is to hold the static data that is shared between all object instances.
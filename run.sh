@@ -5,16 +5,15 @@ set -e
 TOTAL_WORDS=0
 WORDS_IN_PAGE=250
 
+# fixed string hashing, so that the order of sets is the same in each build (see MDF_NORMALIZE in README.md)
+export PYTHONHASHSEED=${MDF_RANDOM_SEED:-0}
+
 make_lesson() {
     local script=$1
     local outfile=$(basename $script .py)".md"
-    local tmpfile=$(basename $script .py)".tmp"
 
-    #echo '" Set text width as 72.' >${tmpfile}
-    #echo "" >>${tmpfile}
-    $script >${tmpfile}
-    python3 -m mdpyformat.tocgen ${tmpfile} ${outfile}
-    #rm ${tmpfile}
+    # runs the lesson and adds the table of contents in one process, without a temporary file
+    python3 -m mdpyformat.build ${script} ${outfile}
 
     WORDS=$(wc -w "${outfile}" | awk '{ print $1 }')
     echo "${WORDS} words in ${outfile}"
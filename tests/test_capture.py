@@ -0,0 +1,60 @@
+import io
+
+from mdpyformat.capture import OutputSink, OutputText, copy_chunks
+
+
+def render(text, max_lines=None, chunk_size=None):
+    """ writes text to an OutputSink (in pieces of chunk_size), returns (rendered text, kept text) """
+    target = io.StringIO()
+    sink = OutputSink(">> ", max_lines, target, block_start="<", block_end=">")
+    pieces = [ text ] if chunk_size is None else list( map( lambda pos : text[ pos : pos + chunk_size ], range(0, len(text), chunk_size) ) )
+    for piece in pieces:
+        sink.write(piece)
+    kept = sink.close_output()
+    return target.getvalue(), kept
+
+
+def test_strip():
+    # leading and trailing whitespace lines are dropped, as by strip(); whitespace lines in between are kept
+    rendered, kept = render("\n  \n  first\n\nsecond  \n \n\n")
+    assert kept == "first\n\nsecond"
+    assert rendered == "<>> first\n>> \n>> second\n>"
+
+def test_strip_in_pieces():
+    text = "\n\n  a\nb\n\n\nc\n   \n"
+    for chunk_size in ( 1, 2, 5 ):
+        assert render(text, chunk_size=chunk_size) == render(text)
+
+def test_no_output():
+    assert render(" \n\n") == ("", "")
+
+def test_elision():
+    text = "".join( map( lambda n : f"line {n}\n", range(10) ) )
+    rendered, kept = render(text, max_lines=3)
+    assert kept == "line 0\nline 1\nline 2\n... 4 lines not shown ...\nline 7\nline 8\nline 9"
+    assert rendered == "<" + "".join( map( lambda line : ">> " + line + "\n", kept.split("\n") ) ) + ">"
+
+def test_no_elision_at_the_limit():
+    text = "".join( map( lambda n : f"line {n}\n", range(6) ) )
+    assert "not shown" not in render(text, max_lines=3)[1]
+
+def test_trailing_whitespace_lines_are_bounded():
+    # whitespace lines that are held back are released once there are more than max_lines of them
+    sink = OutputSink("", 2)
+    sink.write("a\n" + "\n" * 10 + "b\n")
+    assert len(sink.head) + len(sink.tail) <= 4
+    assert sink.close_output() == "a\n\n... 8 lines not shown ...\n\nb"
+
+def test_rendered_lines_are_output_text():
+    target = []
+    sink = OutputSink("", target=type("Target", (), { "write" : lambda self, text : target.append(text) })())
+    sink.write("x\n")
+    sink.close_output()
+    assert isinstance(target[1], OutputText)
+
+def test_copy_chunks_cut_off():
+    data = io.BytesIO("ä".encode() * 10)
+    out = io.StringIO()
+    assert copy_chunks(data.read, out, max_bytes=5) == 15
+    # a character that is cut in half is replaced
+    assert out.getvalue() == "ää�"
@@ -0,0 +1,69 @@
+import io
+
+from mdpyformat.capture import OutputText
+from mdpyformat.document import Document
+from mdpyformat.normalize import Normalizer
+
+
+def test_placeholder_keeps_its_place():
+    document = Document()
+    document.write("a ")
+    first = document.add_placeholder()
+    document.write("c ")
+    second = document.add_placeholder()
+    document.write("e")
+    # filled out of order, the text is in document order
+    document.fill(second, "d ")
+    document.fill(first, "b ")
+    assert document.getvalue() == "a b c d e"
+
+def test_output_stops_at_unfilled_placeholder():
+    target = io.StringIO()
+    document = Document(target, flush_size=0)
+    document.write("before ")
+    placeholder = document.add_placeholder()
+    document.write("after")
+    assert target.getvalue() == "before "
+    document.fill(placeholder, "filled ")
+    assert target.getvalue() == "before filled after"
+
+def test_placeholders_are_resolved_in_order():
+    resolved = []
+    document = Document()
+    def resolver(name):
+        def resolve():
+            resolved.append(name)
+            document.fill(placeholders[name], name)
+        return resolve
+    placeholders = {}
+    for name in ( "x", "y" ):
+        placeholders[name] = document.add_placeholder(resolver(name))
+    assert document.getvalue() == "xy"
+    assert resolved == [ "x", "y" ]
+
+def test_unresolved_placeholder_is_empty():
+    target = io.StringIO()
+    document = Document(target)
+    document.write("a")
+    document.add_placeholder()
+    document.write("b")
+    document.close()
+    assert target.getvalue() == "ab"
+
+def test_truncate_after():
+    document = Document()
+    document.write("kept ")
+    placeholder = document.add_placeholder()
+    document.write("dropped")
+    document.truncate_after(placeholder)
+    document.fill(placeholder, "end")
+    assert document.getvalue() == "kept end"
+
+def test_output_is_normalized_in_document_order():
+    # the placeholder that is filled last comes first in the document, its address gets the first ordinal
+    document = Document(normalizer=Normalizer([ r"\b0x[0-9a-f]{9,}\b" ]))
+    placeholder = document.add_placeholder()
+    document.write(OutputText("0x7f0000000010\n"))
+    document.fill(placeholder, OutputText("0x7f0000000020\n"))
+    document.write("0x7f0000000030\n")
+    assert document.getvalue() == "0x000000000001\n0x000000000002\n0x7f0000000030\n"
@@ -0,0 +1,32 @@
+import os
+import sys
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LESSON = '''#!/usr/bin/env python3
+from mdpyformat import *
+
+eval_and_quote("print(1/0)")
+eval_and_quote("print('after the error')")
+'''
+
+
+def run(tmp_path, *args):
+    (tmp_path / "lesson.py").write_text(LESSON)
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, MDF_KEEP_GOING="1")
+    return subprocess.run([ sys.executable ] + list(args), cwd=tmp_path, env=env, capture_output=True, text=True)
+
+
+def test_lesson_run_directly_exits_with_error(tmp_path):
+    result = run(tmp_path, "lesson.py")
+    assert result.returncode == 1
+    assert ">> after the error" in result.stdout
+    assert "1 failures:" in result.stderr
+
+def test_build_writes_document_with_errors(tmp_path):
+    result = run(tmp_path, "-m", "mdpyformat.build", "lesson.py", "lesson.md")
+    assert result.returncode == 1
+    markdown = (tmp_path / "lesson.md").read_text()
+    assert "division by zero" in markdown
+    assert ">> after the error" in markdown
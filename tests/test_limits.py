@@ -0,0 +1,65 @@
+import io
+import sys
+import time
+import shlex
+
+import pytest
+
+from mdpyformat.limits import Limits, SnippetLimitExceeded, in_process_limits, run_command, resource
+
+# cpu time and memory of a command are limited with setrlimit
+needs_rlimit = pytest.mark.skipif(resource is None, reason="no resource module")
+
+
+def python_command(code):
+    return f"{shlex.quote(sys.executable)} -c {shlex.quote(code)}"
+
+def run(code, limits=Limits(), max_bytes=None):
+    output = io.StringIO()
+    exit_code, error = run_command(python_command(code), limits, output, max_bytes)
+    return exit_code, error, output.getvalue()
+
+
+def test_output_and_exit_code():
+    exit_code, error, output = run("import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)")
+    assert (exit_code, error) == (3, None)
+    assert "out\n" in output and "err\n" in output
+
+def test_timeout():
+    start = time.monotonic()
+    exit_code, error, output = run("import time; print('started', flush=True); time.sleep(30)", Limits(timeout=0.5))
+    assert time.monotonic() - start < 10
+    assert exit_code < 0
+    assert error == "wall time limit of 0.5 seconds exceeded"
+    # the output up to the timeout is kept
+    assert output == "started\n"
+
+@needs_rlimit
+def test_cpu_limit():
+    exit_code, error, _ = run("while True: pass", Limits(cpu_time=1))
+    assert exit_code < 0
+    assert "cpu time limit of 1 seconds exceeded" in error
+
+@needs_rlimit
+def test_memory_limit():
+    exit_code, error, output = run("x = bytearray(1 << 30)", Limits(memory=256 << 20))
+    assert exit_code == 1 and error is None
+    assert "MemoryError" in output
+
+def test_max_bytes():
+    exit_code, _, output = run("print('x' * 1000, end='')", max_bytes=100)
+    assert exit_code == 0
+    assert output == "x" * 100 + "\n... 900 more bytes not shown ...\n"
+
+def test_command_not_found():
+    assert run_command("no-such-command-here --flag", Limits(), io.StringIO()) == (127, "command not found: no-such-command-here")
+
+def test_in_process_timeout():
+    start = time.monotonic()
+    with pytest.raises(SnippetLimitExceeded):
+        with in_process_limits(Limits(timeout=0.2)):
+            while True:
+                pass
+    assert time.monotonic() - start < 5
+    # the timer is stopped
+    time.sleep(0.7)
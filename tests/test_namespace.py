@@ -0,0 +1,68 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LESSON = '''#!/usr/bin/env python3
+from mdpyformat import *
+
+header_md("first")
+
+eval_and_quote("""
+def show_limit():
+    return limit * 2
+""", exports=["show_limit"])
+
+limit = 10
+
+header_md("second")
+
+eval_and_quote("""
+class Twice:
+    value = show_limit()
+print("value", Twice.value)
+""")
+
+limit = 20
+
+eval_and_quote("""
+limit = 3
+print("limit", show_limit())
+""")
+'''
+
+LESSONS = [ "python-obj-system.py", "decorator.py", "gen-iterator.py" ]
+
+
+def build(tmp_path, namespace, lesson="lesson.py"):
+    """ runs the lesson with MDF_NAMESPACE set, returns (markdown, standard error) """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, MDF_NAMESPACE=namespace)
+    result = subprocess.run([ sys.executable, lesson ], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout, result.stderr
+
+
+@pytest.mark.parametrize("namespace", [ "shared", "section", "snippet" ])
+def test_globals_are_read_when_the_snippet_runs(tmp_path, namespace):
+    (tmp_path / "lesson.py").write_text(LESSON)
+    markdown, _ = build(tmp_path, namespace)
+    # the class body reads the lesson global defined after the first section started
+    assert ">> value 20" in markdown
+    # an exported function sees the names of the snippet that calls it
+    assert ">> limit 6" in markdown
+
+def test_retained_memory_is_reported_in_namespace_modes(tmp_path):
+    (tmp_path / "lesson.py").write_text(LESSON)
+    _, err = build(tmp_path, "shared")
+    assert "retained by" not in err
+    _, err = build(tmp_path, "section")
+    assert "retained by" in err
+
+@pytest.mark.parametrize("namespace", [ "section", "snippet" ])
+@pytest.mark.parametrize("lesson", LESSONS)
+def test_lessons_build_in_namespace_modes(tmp_path, namespace, lesson):
+    markdown, _ = build(tmp_path, namespace, os.path.join(REPO_DIR, lesson))
+    assert "Error in code" not in markdown
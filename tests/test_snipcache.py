@@ -0,0 +1,128 @@
+import os
+import sys
+import subprocess
+
+from mdpyformat.snipcache import ResultCache
+from mdpyformat.snipdeps import SnippetGraph
+from mdpyformat import normalize
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# each snippet appends its name to runs.log, when it is executed
+LESSON = '''#!/usr/bin/env python3
+from mdpyformat import *
+
+eval_and_quote("""
+a = {a_value}
+open("runs.log", "a").write("a\\\\n")
+print("a is", a)
+""")
+
+eval_and_quote("""
+b = a + 1
+open("runs.log", "a").write("b\\\\n")
+print("b is", b)
+""")
+
+eval_and_quote("""
+c = 3
+open("runs.log", "a").write("c\\\\n")
+print("c is", c)
+""")
+'''
+
+# shows an object address, it is not cached
+SHOW_ADDRESS = '''
+eval_and_quote("""
+class Foo:
+    pass
+open("runs.log", "a").write("foo\\\\n")
+print("id of Foo", id(Foo), Foo())
+""")
+'''
+
+
+def build(tmp_path, a_value=1, incremental=False, show_address=False):
+    """ build the lesson with the cache in tmp_path, returns (markdown, names of the snippets that were executed) """
+    (tmp_path / "lesson.py").write_text(LESSON.format(a_value=a_value) + (SHOW_ADDRESS if show_address else ""))
+    log = tmp_path / "runs.log"
+    if log.exists():
+        log.unlink()
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, MDF_CACHE_DIR=str(tmp_path / "cache"), MDF_INCREMENTAL="1" if incremental else "0")
+    subprocess.run([ sys.executable, "-m", "mdpyformat.build", "lesson.py", "lesson.md" ], cwd=tmp_path, env=env, check=True, capture_output=True)
+    runs = log.read_text().split() if log.exists() else []
+    return (tmp_path / "lesson.md").read_text(), runs
+
+
+def test_make_key_separates_parts():
+    assert ResultCache.make_key("ab", "c") == ResultCache.make_key("ab", "c")
+    assert ResultCache.make_key("ab", "c") != ResultCache.make_key("a", "bc")
+
+
+def test_put_get(tmp_path):
+    cache = ResultCache(str(tmp_path), 1024 * 1024, "test")
+    key = ResultCache.make_key("snippet")
+    assert cache.get(key) is None
+    assert not cache.contains(key)
+    cache.put(key, [ "out", "err" ])
+    assert cache.contains(key)
+    assert cache.get(key) == [ "out", "err" ]
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_incremental_keys():
+    first = SnippetGraph(ResultCache.make_key)
+    second = SnippetGraph(ResultCache.make_key)
+    keys = []
+    for graph, a_value in ( (first, 1), (second, 2) ):
+        keys.append( list( map( lambda source : graph.add(source).key, [ f"a = {a_value}", "b = a + 1", "c = 3" ] ) ) )
+    # the edited snippet and the one that reads a get new keys, the independent one keeps its key
+    assert keys[0][0] != keys[1][0]
+    assert keys[0][1] != keys[1][1]
+    assert keys[0][2] == keys[1][2]
+    assert second.upstream(1) == {0}
+    assert second.upstream(2) == set()
+
+
+def test_contains_address():
+    assert normalize.contains_address("<Foo object at 0x7f3a5c2b1e80>")
+    assert normalize.contains_address("id: 140234567891232")
+    assert not normalize.contains_address("mask 0xffffffff big 12345678901")
+
+
+def test_replay(tmp_path):
+    text, runs = build(tmp_path)
+    assert runs == [ "a", "b", "c" ]
+    replayed, runs = build(tmp_path)
+    assert runs == []
+    assert replayed == text
+
+
+def test_address_is_not_cached(tmp_path):
+    build(tmp_path, show_address=True)
+    text, runs = build(tmp_path, show_address=True)
+    # the snippet that shows an address runs again, the replayed snippets before it run first (their output is not shown twice)
+    assert runs == [ "a", "b", "c", "foo" ]
+    assert text.count("a is 1") == 1
+
+
+def test_incremental_address_is_not_cached(tmp_path):
+    build(tmp_path, incremental=True, show_address=True)
+    _, runs = build(tmp_path, incremental=True, show_address=True)
+    # the snippet doesn't depend on the replayed ones, they don't have to run
+    assert runs == [ "foo" ]
+
+
+def test_invalidation(tmp_path):
+    build(tmp_path)
+    _, runs = build(tmp_path, a_value=2)
+    # the key of a snippet covers all snippets before it
+    assert runs == [ "a", "b", "c" ]
+
+
+def test_incremental_invalidation(tmp_path):
+    build(tmp_path, incremental=True)
+    text, runs = build(tmp_path, a_value=2, incremental=True)
+    # the key of a snippet covers only the snippets it depends on
+    assert runs == [ "a", "b" ]
+    assert "b is 3" in text
@@ -0,0 +1,92 @@
+import os
+
+from mdpyformat import mdf as _mdf
+from mdpyformat.parallel import ParallelSnippets
+from mdpyformat.snipcache import ResultCache
+from mdpyformat.snipdeps import SnippetGraph, snippet_names
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_all(sources):
+    graph = SnippetGraph(ResultCache.make_key)
+    return graph, list( map( lambda source : graph.add(source), sources ) )
+
+
+def test_pure_snippets():
+    assert snippet_names("import math\nprint(math.sqrt(2))").is_pure
+    assert not snippet_names("import random\nprint(random.random())").is_pure
+    assert snippet_names("a = object()\nprint(id(a) == id(a))").is_pure
+    assert snippet_names("class C:\n    pass\nprint(dir(C()))").is_pure
+    # dir() without arguments lists the namespace
+    assert snippet_names("print(dir())").is_dynamic
+    assert not snippet_names("await asyncio.sleep(1)").is_pure
+    assert not snippet_names("exec('x = 1')").is_pure
+
+
+def test_global_reads():
+    names = snippet_names("def f(a):\n    return a + b\nclass C:\n    x = 1\n    def m(self):\n        return self.x + len(c)")
+    assert names.global_reads == { "b", "c", "len" }
+
+
+def test_self_contained():
+    graph, nodes = add_all([ "import functools", "import math\ndef f(a):\n    return math.sqrt(a)", "print(f(4))", "import random\nx = random.random()",
+                             "print(x)", "print(lesson_function())", "def g():\n    return h()\nh = f\nprint(g())" ])
+    assert graph.is_self_contained(nodes[2].index)
+    # depends on an impure snippet
+    assert not graph.is_self_contained(nodes[4].index)
+    # refers to a name that the snippets don't define
+    assert not graph.is_self_contained(nodes[5].index)
+    assert graph.is_self_contained(nodes[6].index)
+
+
+def test_defined_later():
+    # functools is read before the snippet that imports it: in the lesson it comes from the lesson code
+    graph, nodes = add_all([ "def f():\n    return functools.reduce", "import functools\nprint(f())" ])
+    assert not graph.is_self_contained(nodes[1].index)
+
+
+def test_call_touches_globals_of_function():
+    graph, nodes = add_all([ "x = 1", "registry = []", "def set_x(value):\n    global x\n    x = value", "def register(item):\n    registry.append(item)",
+                             "set_x(2)", "register('a')", "print(x)", "print(registry)" ])
+    assert graph.upstream(nodes[4].index) >= { 0, 2 }
+    assert graph.upstream(nodes[5].index) >= { 1, 3 }
+    # the readers of x and registry depend on the calls that changed them
+    assert 4 in nodes[6].deps
+    assert 5 in nodes[7].deps
+
+
+def test_method_call_touches_globals_of_class():
+    graph, nodes = add_all([ "log = []", "class Logger:\n    def add(self, item):\n        log.append(item)", "logger = Logger()",
+                             "logger.add(1)", "print(log)" ])
+    assert 0 in graph.upstream(nodes[3].index)
+    assert 3 in nodes[4].deps
+
+
+def test_incremental_key_follows_function_effects():
+    keys = []
+    for value in ( 1, 2 ):
+        graph, nodes = add_all([ "x = 0", "def set_x():\n    global x\n    x = %d" % value, "set_x()", "print(x)" ])
+        keys.append( list( map( lambda node : node.key, nodes ) ) )
+    # editing the function changes the key of the snippet that shows x
+    assert keys[0][3] != keys[1][3]
+
+
+def dispatched(lesson):
+    """ indexes of the snippets of the lesson that the process pool would run """
+    globals_dict = { "__file__" : os.path.join(REPO_DIR, lesson) }
+    indexes = []
+    def should_submit(node, _digest):
+        # the snippets are recorded, but not run
+        if _mdf._can_skip_snippet(node, globals_dict):
+            indexes.append(node.index)
+        return False
+    parallel = ParallelSnippets(globals_dict, 1, _mdf._default_limits(), should_submit, "thread")
+    parallel.pool.shutdown()
+    return indexes
+
+
+def test_python_obj_system_dispatch():
+    # most snippets use the class Foo of the first snippet, which calls print_md of the lesson; the others are read by the lesson code.
+    # Only the enum example is on its own.
+    assert dispatched("python-obj-system.py") == [ 34 ]
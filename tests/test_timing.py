@@ -0,0 +1,13 @@
+from mdpyformat.timing import TimingResult, format_table
+
+
+def test_confidence_interval_is_not_negative():
+    # an outlier among few samples: mean - t * stdev / sqrt(n) is below zero
+    result = TimingResult("noisy", "key", 1, [ 1e-6, 1e-6, 5e-5 ])
+    assert result.ci_low == 0.0
+    assert result.ci_high > result.mean
+    assert "-" not in format_table([ result ], 0.1).splitlines()[2].split("|")[6]
+
+def test_confidence_interval_of_steady_samples():
+    result = TimingResult("steady", "key", 1, [ 1.0, 1.0, 1.0 ])
+    assert result.ci_low == result.ci_high == 1.0
@@ -0,0 +1,89 @@
+import io
+import os
+
+import pytest
+
+from mdpyformat import tocgen
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reference_toc(data):
+    """ the table of contents as added by the original tocgen, that read the whole file and split it on ``` """
+    toc = []
+    levels = [0,0,0,0,0]
+    tempFile = []
+    tocLoc = 0
+    partOfToc = False
+    is_text = True
+    section_start = 0
+    while True:
+        section_end = data.find("```", section_start)
+        if section_end == -1:
+            section_end = len(data)
+        text_section = data[ section_start : section_end ]
+        section_start = section_end + 3
+        if is_text:
+            is_text = False
+            for line in text_section.split('\n'):
+                line = line + '\n'
+                if partOfToc and line != '\n':
+                    continue
+                partOfToc = False
+                if 'Table of Contents' in line:
+                    tocLoc = len(tempFile) + 1
+                    partOfToc = True
+                elif line[0] == '#':
+                    secId = tocgen.buildToc(line, toc, levels)
+                    line = tocgen.addSectionTag(tocgen.cleanLine(line), secId) + '\n'
+                tempFile.append(line)
+        else:
+            is_text = True
+            tempFile += [ "```", text_section, "```" ]
+        if section_start >= len(data):
+            break
+    tempFile[tocLoc : tocLoc] = toc + [ "\n" ]
+    return "".join(tempFile)
+
+def process(data):
+    out = io.StringIO()
+    tocgen.processFile(io.StringIO(data), out)
+    return out.getvalue()
+
+
+CASES = [
+    "",
+    "# One\ntext\n## Two\n### Three\n#### Four\n# Five\n## Six\n",
+    "intro\n\nTable of Contents\nold entry\nold entry\n\n# One\n## Two\n",
+    "Table of Contents\n\n# One\nTable of Contents\n\n## Two\n",
+    "# Code\n```python\n# not a header\nprint(1)\n```\n## After\n",
+    "text ``` inline # code ``` more\n# Header\n",
+    "# Unclosed\n```\n# inside\n",
+    "# Fence at the end\n```",
+    "```\n```\n# Adjacent\n``````\n",
+    "no newline at the end\n# <a id='x' />Anchor",
+]
+
+@pytest.mark.parametrize("data", CASES)
+def test_same_output_as_reference(data):
+    assert process(data) == reference_toc(data)
+
+@pytest.mark.parametrize("lesson", [ "python-obj-system.md", "decorator.md", "gen-iterator.md" ])
+def test_lesson_documents(lesson):
+    with open(os.path.join(REPO_DIR, lesson), "r") as file:
+        data = file.read()
+    assert process(data) == reference_toc(data)
+
+def test_file_names_and_pipes(tmp_path):
+    data = CASES[4]
+    (tmp_path / "in.md").write_text(data)
+    tocgen.processFile(str(tmp_path / "in.md"), str(tmp_path / "out.md"))
+    assert (tmp_path / "out.md").read_text() == reference_toc(data)
+    # input that can't be rewound is read twice as well
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, data.encode())
+    os.close(write_fd)
+    out = io.StringIO()
+    with open(read_fd, "r") as pipe:
+        tocgen.processFile(pipe, out)
+    assert out.getvalue() == reference_toc(data)